@@ -16,44 +16,41 @@ Usage:
 Output:
     - source_genomes_{i}/ folders. i represents as many groups of genomes sharing ANI > ANI_threshold with and size > 15 genomes. 
     - test_genomes/ folder with the rest of the genomes
+    - genome_groups.tsv manifest with the group (output folder) and path of each genome
 
 Dependencies:
-    - networkx
-    - pandas
+    - ani_clustering (this repository)
+    - ani_matrix (this repository)
+    - genome_store (this repository)
+    - numpy
     - sys
     - pathlib
-    - zipfile
-    - os
-    - shutil
     - sys
+    - collections
     
 Notes:
-    - Full directory name found in the names of the genomes in the fastANI output file has to be given in the code 
-    for a correct data processing
+    - Genomes are read in place from SAR11_genomes.zip (or the SAR11_genomes/ folder if the archive is missing) and
+      placed in the group folders as hardlinks by default. The link mode can be changed in the code
+    - Genome names are taken from the basenames of the fastANI paths. The table is converted once into a
+      memory-mapped ANI matrix ({fastANI_results}.matrix/) that is reused by later runs
 """
 
 # To be changed by user
-full_dir = "/home/estudiante2/JMF/other_thresholds/SAR11_genomes/"
+link_mode = "hardlink"  # How genomes are placed in group folders: hardlink, symlink, reflink or copy
+workers = 8             # Genomes placed in parallel (useful when they have to be copied)
+manifest_name = "genome_groups.tsv"
 
 
 ## LIBRARIES
-import pandas as pd
-import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
 from pathlib import Path
-import shutil
 import sys
-import os
-import zipfile
-
-## FUNCTIONS
-def copy_file(name, in_folder, out_folder):
-    "Copies a file from SAR11 genomes input directory to a target output directory"
-    filename = f'{name}.fa'
-    in_path = os.path.join(in_folder, filename)
-    out_path = os.path.join(out_folder, filename)
-    shutil.copyfile(in_path, out_path)
-    print(f'Copied {name} --> {out_folder}')
+from collections import Counter
+
+from ani_clustering import matrix_components, membership
+from ani_matrix import load_matrix
+from genome_store import open_store, stage_genomes, write_manifest
 
 ## CHECK ARGUMENTS
 args = sys.argv
@@ -62,55 +59,32 @@ if len(args) != 3:
     sys.exit(1)
 
 df_name = args[1]
-colnames = ["Query", "Reference", "ANI", "Bidirectional mappings", "Query fragments"]
 try:
-    df = pd.read_csv(df_name, sep = '\t', names = colnames, header = None)
+    matrix = load_matrix(df_name)
 except Exception as e:
     print(f'Error reading {df_name}:{e}')
     sys.exit(1)
 
-df["Query"] = df["Query"].str.replace(full_dir, "", regex=False)
-df["Query"] = df["Query"].str.replace('.fa', "", regex=False)
-df["Reference"] = df["Reference"].str.replace(full_dir, "", regex=False)
-df["Reference"] = df["Reference"].str.replace('.fa', "", regex=False)
-
-df.head(10)
-
 # Extract all relations with ANI > threshold
-ANI_th = args[2]
-
 try:
-    to_group = df[(df["ANI"] >= ANI_th) & (df["Query"] != df["Reference"])]
-except:
-    print(f"Error: invalid ANI threshold: {ANI_th}")
+    ANI_th = float(args[2])
+except ValueError:
+    print(f"Error: invalid ANI threshold: {args[2]}")
     sys.exit(1)
 
+src, dst = matrix.edges(ANI_th)
 
-uniques = set(to_group["Query"].tolist())
+
+uniques = np.unique(src)
 print('Unique sequences found:', len(uniques))
-all_uniques = set(df["Query"].tolist())
+all_uniques = np.flatnonzero(matrix.queried())
 print('All unique sequences:', len(all_uniques))
 
 
 ### GROUPING
 
-# Create new graph
-G=nx.Graph()
-
-# Nodes
-for unique in uniques:
-    G.add_node(unique)
-
-# Edges
-for idx, row in to_group.iterrows():
-    node1 = row["Query"]
-    node2 = row["Reference"]
-    G.add_edge(node1, node2)  
-
-
-# Connected componets of the graph
-components = list(nx.connected_components(G))
-components = sorted(components, key = len)
+# Connected componets of the ANI >= threshold graph, sorted by size
+components = matrix_components(matrix, ANI_th)
 
 print("Groups found:")
 for i, comp in enumerate(components):
@@ -122,47 +96,35 @@ for i, comp in enumerate(components):
 ## Else --> is a test genome, store in folder test_genomes
 
 in_zip = "SAR11_genomes.zip"
-in_folder = "SAR11_genomes"
-
-# Uncompress zip with SAR11 genomes 
-if not os.path.exists(in_folder):
-    with zipfile.ZipFile(in_zip, 'r') as zip_ref:
-        zip_ref.extractall(in_folder)
-        print(f"{in_zip} extracted to {in_folder}")
-        
-# Generate test output folder 
+
+# Read SAR11 genomes in place (only the genomes needed are extracted, once)
+store = open_store(in_zip)
+
+# Genome -> output folder map, built once
 test_out_folder = 'test_genomes'
-os.makedirs(test_out_folder, exist_ok = True)
-
-# Process source genomes
-s = False
-source_num = 1
-components_list = []
-
-for component in components:
-    if len(component) >= 15:  # Source group found
-        s = True
-        source_out_folder = f'source_genomes_{source_num}'  # Create specific folder
-        os.makedirs(source_out_folder, exist_ok = True)
-        components_list.append(list(component))
-        components_list += 1
-        
-if not s:
+source_components = [component for component in components if len(component) >= 15]  # Source groups found
+
+if not source_components:
     print('No group of size >= 15 found according to ANI!')
     print('Analysis finished. No output generated')
+    store.close()
     exit(1)
 
+source_groups = membership(source_components)
+assignments = {}
+for genome_name in store.names():
+    if genome_name in source_groups:
+        assignments[genome_name] = f'source_genomes_{source_groups[genome_name] + 1}'
+    else:  # Test genome
+        assignments[genome_name] = test_out_folder
+
 ## Store genomes
-source_genomes = []
-for genome in os.listdir(in_folder):
-    for i, sublist in enumerate(components_list): # Seach specific source component in which the genome is found
-        genome_name = genome.replace('.fa', '')
-        if genome_name in sublist:
-            source_genomes.append[genome_name]
-            copy_file(genome, in_folder, f'source_genomes_{i + 1}') # Copy to specific folder
+staged = stage_genomes(store, assignments, link_mode, workers)
+write_manifest(staged, assignments, manifest_name)
+store.close()
 
-    if genome not in source_genomes: # If test genome, copy to test folder
-        copy_file(genome, in_folder, test_out_folder)
+for folder, count in sorted(Counter(assignments.values()).items()):
+    print(f'{count} genomes --> {folder}')
 
 print('\nAnalysis completed! Results are available in folders source_genomes and test_genomes')
-
+print(f'Genome groups are listed in {manifest_name}')
@@ -8,41 +8,93 @@ Date: 2025-12-18
 Version: 1.0
 
 Usage:
-    python CSF_clades_analysis.py genomes_list.txt source_dir1 source_dir2 ... source_dirn
+    python CSF_clades_analysis.py genomes_list.txt source_dir1 source_dir2 ... source_dirn [--seed N]
 
 Output:
     - CSF_clades_results.json dictionary with analysis results
+    - CSF_clades_journal.jsonl journal with the plan of the run and the result of every finished job
 
 Dependencies:
     - conda
     - conda environment "CSF" with python 2.7.
     - ConSpeciFix
+    - ani_matrix (this repository)
+    - csf_cache (this repository)
+    - csf_journal (this repository)
+    - csf_pruning (this repository)
+    - csf_scheduler (this repository)
+    - csf_workspace (this repository)
     - sys
     - json
     - os
-    - shutil
-    - subprocess
     - collections
     
 Notes:
     - Requires a .txt file with a list containing the names of all test genomes 
     - Requires test groups folders (divided by clades) with names clade_{num}/ in current directory
     - May require change ConSpeciFix runner_personal.py file location in the code
+    - All (test genome, source) comparisons are enumerated first and run in parallel. Number of concurrent jobs,
+      threads per job and memory budget can be changed directly in the code
+    - ConSpeciFix is run by long-lived drivers (csf_worker.py) started once inside the CSF environment
+    - Input genomes are copied once (read-only) to scratch_root and job folders are built there with links.
+      scratch_root can be a fast local disk or tmpfs, and disk_budget_gb limits the space the jobs use
+    - Every finished job is appended to the journal. If the run is interrupted, running it again with the same
+      arguments resumes it: the same test genomes are used and only the jobs without result are run
+    - --seed makes the random selection of test genomes reproducible
+    - Outcomes are cached in outcome_cache_path by test genome contents, source genomes and ConSpeciFix version,
+      so comparisons run before (in this or other runs) are not run again
+    - If fastani_results is set, jobs whose test genome has max ANI below ani_floor against the source genomes
+      are not run and are recorded as inferred negatives (with the ANI values as reason in the journal)
     - Recommended to run in background
 """
 
+# To be changed by user
+conspecifix_runner = "/home/estudiante2/JMF/ConSpeciFix/ConSpeciFix-1.3.0/database/runner_personal.py"
+workers = 4                 # Max ConSpeciFix jobs at once
+threads_per_job = 1
+memory_per_job_gb = None    # Peak memory of one job (None: no memory limit on the number of jobs)
+total_memory_gb = None
+persistent_workers = True   # Keep one ConSpeciFix driver per job slot instead of running `conda run` for every job
+scratch_root = "CSF_workspaces" # Job folders and read-only input copies (fast local disk or tmpfs)
+link_mode = "hardlink"      # hardlink / symlink / reflink / copy of the inputs into the job folders
+disk_budget_gb = None       # Max space used in scratch_root (None: only keep 1 GB free)
+journal_path = "CSF_clades_journal.jsonl"
+outcome_cache_path = "CSF_outcomes.sqlite"
+fastani_results = None      # fastANI table used to prune distant test-source pairs (None: no pruning)
+ani_floor = 80              # Jobs with max ANI below it are inferred negatives (fastANI reports from ~80%)
+csf_version = None          # ConSpeciFix version of the cached outcomes (None: from the runner path and script)
+
 
 # -- PACKAGES --
-import subprocess
 import sys
 import os
-import shutil
 import random
 import json
 from collections import defaultdict
 
+from ani_matrix import load_matrix
+from csf_cache import OutcomeCache, conspecifix_version
+from csf_journal import ResultsJournal
+from csf_pruning import prune_jobs
+from csf_scheduler import CSFJob, run_jobs
+from csf_workspace import WorkspaceManager
+
 # -- ARGUMENTS CHECK --
-all_genomes_file = sys.argv[1]
+args = sys.argv[1:]
+if '--seed' in args:  # Reproducible selection of test genomes
+    position = args.index('--seed')
+    try:
+        random.seed(int(args[position + 1]))
+    except (IndexError, ValueError):
+        print('Error: --seed requires an integer value')
+        sys.exit(1)
+    del args[position:position + 2]
+
+if len(args) < 2:
+    print('Use: CSF_clades_analysis.py genomes_list.txt source_dir1 ... source_dirn [--seed N]')
+    sys.exit(1)
+
+all_genomes_file = args[0]
 
 try:
     with open(all_genomes_file, 'r') as file:
@@ -51,7 +103,7 @@ except Exception as e:
     print(f'Error reading file with all genomes: {e}')
     sys.exit(1)
 
-srcs = [s for s in sys.argv[2:len(sys.argv)]]
+srcs = [s for s in args[1:]]
 
 for src in srcs:
     if not os.path.exists(src):
@@ -59,82 +111,6 @@ for src in srcs:
         print('Please, provide a valid input')
         sys.exit(1)
 
-# -- FUNCTIONS --
-def run_conspecific(subfolder_path):
-    """
-    Executes ConSpeciFix Python 2.7 using conda environment 'CSF'
-    """
-
-    command = [
-        "conda", "run", "-n", "CSF",
-        "python",
-        "/home/estudiante2/JMF/ConSpeciFix/ConSpeciFix-1.3.0/database/runner_personal.py", # Change to ConSpeciFix location
-        subfolder_path
-    ]
-
-    try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-
-    except subprocess.CalledProcessError as e:
-        print("ERROR running ConSpeciFix")
-        print("STDOUT:\n", e.stdout)
-        print("STDERR:\n", e.stderr)
-
-
-def parse_results(results_dir, genome):
-    """Parses a results.txt file from ConSpeciFix and checks whether test genome belong to same species or not"""
-    # Read results file
-    with open(results_dir, 'r') as file:
-        text = file.readlines()
-
-    # Parse text and store same species and different species
-    species = False
-    not_species = False
-
-    same_species = []
-    diff_species = []
-
-    for line in text:
-        line = line.rstrip('\n')
-
-        if line == 'The following strains are members of the species:':
-            species = True
-            continue
-
-        if line == 'The following strains were determined to NOT be a member of the species:':
-            species = False
-            continue
-
-        if species and line:
-            same_species.append(line)
-
-    print(f'\n\nProcessing test genome {genome} ...')
-
-    # Check if same species
-    if genome in same_species:
-        return True
-    else:
-        return False
-    
-def extract_and_copy_gno2(new_dir, out_dir, new_name):
-    "Searches for gno2 plot and stores it in directory results_plots with a new name"
-
-    gno2_path = os.path.join(new_dir, "_conspecifix/database/User_spec/gno2.png")
-
-    dst_path = os.path.join(out_dir, f"{new_name}")
-
-    try:
-        shutil.copy(gno2_path, dst_path)
-        print(f"Saved plot: {dst_path}")
-    except Exception as e:
-        print(f'Error copying gon2.png plot: {e}')
-
-
 # -- MAIN PROGRAM --
 
 # Get all possible clades
@@ -142,91 +118,97 @@ all_clades = []
 for genome in all_genomes:
     all_clades.append(genome.split('_')[1].replace('.fa', ''))
 
-unique_clades = set(all_clades)
+unique_clades = sorted(set(all_clades))  # Sorted, so that --seed gives the same selection
 
 # Create directory to store interesting plots
 out_dir = "CSF_results_and_plots"
 os.makedirs(out_dir, exist_ok=True)
 
-# Structure with final results
-all_output = {}
-
-for clade in unique_clades:
-    folder_name = f'clade_{clade}'
-    test_num = 2
-
-    clade_dict = defaultdict(list)
-
-    # Check if groups folder exists
-    if not os.path.isdir(folder_name): 
-        print(f'No folder for clade {clade}')
-        continue
-
-    # Select random genome from the folder name
-    files = [f for f in os.listdir(folder_name) if os.path.isfile(os.path.join(folder_name, f))] 
-
-    if len(files) < test_num:
-        test_num = len(files)
-
-    for genome in random.sample(files, k=test_num):   
-
-        genome_name = genome.replace('.fa', '').replace('anotated_', '')
-        genome_path = os.path.join(folder_name, genome)
-
-        # Test with each source 
-        for source_num, source_folder in enumerate(srcs):
-            source_num_str = str(source_num + 1)
-            analysis_folder_name = f'analysis_folder_{clade}_{genome_name}_s{source_num + 1}'
-
-            os.makedirs(analysis_folder_name)
-            analysis_folder_abspath = os.path.abspath(analysis_folder_name)
-
-            # Copy test genome
-            shutil.copy(genome_path, os.path.join(analysis_folder_name, genome))
-
-            # Copy source genomes
-            for f in os.listdir(source_folder):
-                src_f = os.path.join(source_folder, f)
-                dst_f = os.path.join(analysis_folder_name, f)
-                if os.path.isfile(src_f):
-                    shutil.copy(src_f, dst_f)
-
-            # Run ConSpeciFix
-            print(f'\nRunning ConSpeciFix between {genome_name} in clade {clade} and source {source_num + 1}')
-            run_conspecific(analysis_folder_abspath)
-
-            # Parse results.txt file 
-            results_path = os.path.join(analysis_folder_name, "results.txt")
-
-            if not os.path.isfile(results_path):
-                print("Error: no file results.txt retrieved for the analysis\n")
-                shutil.rmtree(analysis_folder_name)
-                continue  
-
-            # Extract results.txt gno2.png plot and store it in output folder
-            analysis = f'{genome}_{clade}_s{source_num}' 
-            resultsname = f'{analysis}_results.txt'
-            results_out_path = os.path.join(out_dir, resultsname)
-            shutil.copy(results_path, results_out_path)
-
-            plotname = f'{analysis}_gno2.png'
-            extract_and_copy_gno2(analysis_folder_name, out_dir, plotname)
-
-            # Search if test genome belongs to same species as source
-            species = parse_results(results_path, genome)
-            if species:
-                print(f'{genome_name} belongs to same specie as group {source_folder}!')
-                clade_dict[source_num_str].append(1)
-            else:
-                print(f'{genome_name} DOES NOT belong to same specie as group {source_folder}!!')
-                clade_dict[source_num_str].append(0)
+# Results journal: a run started again with the same arguments resumes its plan
+try:
+    journal = ResultsJournal(journal_path, arguments=sys.argv[1:])  # With --seed, so other seeds start a new run
+except ValueError as e:
+    print(f'Error: {e}')
+    sys.exit(1)
 
-            shutil.rmtree(analysis_folder_name)
+if journal.jobs is None:
+    # Enumerate all (test genome, source) jobs
+    jobs = []
+    clades = []  # Clades with folder, in the order of the final results
 
-    all_output[clade] = clade_dict
+    for clade in unique_clades:
+        folder_name = f'clade_{clade}'
+        test_num = 2
 
-    print('')
-    print('')
+        # Check if groups folder exists
+        if not os.path.isdir(folder_name): 
+            print(f'No folder for clade {clade}')
+            continue
+        clades.append(clade)
+
+        # Select random genome from the folder name
+        files = sorted(f for f in os.listdir(folder_name) if os.path.isfile(os.path.join(folder_name, f)))
+
+        if len(files) < test_num:
+            test_num = len(files)
+
+        for genome in random.sample(files, k=test_num):   
+
+            genome_name = genome.replace('.fa', '').replace('anotated_', '')
+            genome_path = os.path.join(folder_name, genome)
+
+            # Test with each source 
+            for source_num, source_folder in enumerate(srcs):
+                job = CSFJob(
+                    name=f'{genome_name} in clade {clade} vs source {source_num + 1}',
+                    test_genome=genome_path,
+                    source_folder=source_folder,
+                    work_dir=f'analysis_folder_{clade}_{genome_name}_s{source_num + 1}',
+                    out_prefix=f'{genome}_{clade}_s{source_num}',
+                    labels={"clade": clade, "source": str(source_num + 1)},
+                )
+                jobs.append(job)
+
+    journal.start(jobs, info={"clades": clades})
+else:
+    jobs, clades = journal.jobs, journal.info["clades"]
+
+pending = journal.pending(jobs)
+if len(pending) < len(jobs):
+    print(f'Resuming {journal_path}: {len(jobs) - len(pending)} of {len(jobs)} jobs already finished')
+
+# Distant test-source pairs are inferred negatives (not run)
+if fastani_results is not None:
+    pending, pruned = prune_jobs(pending, load_matrix(fastani_results), ani_floor)
+    for job, reason in pruned:
+        journal.add(job, False, reason=reason)
+    print(f'{len(pruned)} jobs pruned by ANI (max ANI below {ani_floor}), recorded as inferred negatives\n')
+
+
+# Run ConSpeciFix jobs in parallel
+def report(job, species):
+    journal.add(job, species)
+    if species is None:
+        return
+    if species:
+        print(f'\t{job.genome} belongs to same specie as group {job.source_folder}!')
+    else:
+        print(f'\t{job.genome} DOES NOT belong to same specie as group {job.source_folder}!!')
+
+run_jobs(
+    pending, out_dir, workers=workers, threads_per_job=threads_per_job,
+    memory_per_job_gb=memory_per_job_gb, total_memory_gb=total_memory_gb,
+    runner=conspecifix_runner, persistent=persistent_workers, on_result=report,
+    workspace=WorkspaceManager(scratch_root, link_mode, disk_budget_gb),
+    outcome_cache=OutcomeCache(outcome_cache_path, csf_version or conspecifix_version(conspecifix_runner))
+)
+
+# Structure with final results (derived from the journal, in job order as the serial analysis did)
+results = journal.outcomes(jobs)
+all_output = {clade: defaultdict(list) for clade in clades}
+for job, species in zip(jobs, results):
+    if species is not None:
+        all_output[job.labels["clade"]][job.labels["source"]].append(1 if species else 0)
 
 # Store final results
 with open('CSF_clades_results.json', 'w') as file:
@@ -8,42 +8,91 @@ Date: 2025-12-15
 Version: 1.0
 
 Usage:
-    python CSF_sources_analysis.py dir1 dir2 ... dirn
+    python CSF_sources_analysis.py dir1 dir2 ... dirn [--seed N]
 
 Output:
     - CSF_source_results.json dictionary with analysis results
+    - CSF_source_journal.jsonl journal with the plan of the run and the result of every finished job
 
 Dependencies:
     - conda
     - conda environment "CSF" with python 2.7.
     - ConSpeciFix
+    - ani_matrix (this repository)
+    - csf_cache (this repository)
+    - csf_journal (this repository)
+    - csf_pruning (this repository)
+    - csf_scheduler (this repository)
+    - csf_workspace (this repository)
     - sys
     - json
     - os
-    - shutil
-    - subprocess
     
 Notes:
     - Only needed if many source groups are formed during ANI clustering
     - Can process as many directories as given. Note that computing time may considerably increase if a great number is offered
     - May require change ConSpeciFix runner_personal.py file location in the code
+    - All test-source comparisons are enumerated first and run in parallel. Number of concurrent jobs, threads per
+      job and memory budget can be changed directly in the code
+    - ConSpeciFix is run by long-lived drivers (csf_worker.py) started once inside the CSF environment
+    - Input genomes are copied once (read-only) to scratch_root and job folders are built there with links.
+      scratch_root can be a fast local disk or tmpfs, and disk_budget_gb limits the space the jobs use
+    - Folders of failed jobs are kept in {scratch_root}/jobs/ (removed first if the disk budget runs out)
+    - Every finished job is appended to the journal. If the run is interrupted, running it again with the same
+      arguments resumes it: the same test genomes are used and only the jobs without result are run
+    - --seed makes the random selection of test genomes reproducible
+    - Outcomes are cached in outcome_cache_path by test genome contents, source genomes and ConSpeciFix version,
+      so comparisons run before (in this or other runs) are not run again
+    - If fastani_results is set, jobs whose test genome has max ANI below ani_floor against the source genomes
+      are not run and are recorded as inferred negatives (with the ANI values as reason in the journal)
     - Recommended to run in background  
 """
 
+# To be changed by user
+conspecifix_runner = "/home/estudiante2/JMF/ConSpeciFix/ConSpeciFix-1.3.0/database/runner_personal.py"
+workers = 4                 # Max ConSpeciFix jobs at once
+threads_per_job = 1
+memory_per_job_gb = None    # Peak memory of one job (None: no memory limit on the number of jobs)
+total_memory_gb = None
+persistent_workers = True   # Keep one ConSpeciFix driver per job slot instead of running `conda run` for every job
+scratch_root = "CSF_workspaces" # Job folders and read-only input copies (fast local disk or tmpfs)
+link_mode = "hardlink"      # hardlink / symlink / reflink / copy of the inputs into the job folders
+disk_budget_gb = None       # Max space used in scratch_root (None: only keep 1 GB free)
+journal_path = "CSF_source_journal.jsonl"
+outcome_cache_path = "CSF_outcomes.sqlite"
+fastani_results = None      # fastANI table used to prune distant test-source pairs (None: no pruning)
+ani_floor = 80              # Jobs with max ANI below it are inferred negatives (fastANI reports from ~80%)
+csf_version = None          # ConSpeciFix version of the cached outcomes (None: from the runner path and script)
+
 # -- PACKAGES --
-import subprocess
 import sys
 import os
 import random
-import shutil
 import json
 
+from ani_matrix import load_matrix
+from csf_cache import OutcomeCache, conspecifix_version
+from csf_journal import ResultsJournal
+from csf_pruning import prune_jobs
+from csf_scheduler import CSFJob, run_jobs
+from csf_workspace import WorkspaceManager
+
 # -- ARGUMENTS CHECK --
-if len(sys.argv) <= 2:
-    print('Use: CSF_sources_analysis.py dir1 dir2 ... dirn')
+args = sys.argv[1:]
+if '--seed' in args:  # Reproducible selection of test genomes
+    position = args.index('--seed')
+    try:
+        random.seed(int(args[position + 1]))
+    except (IndexError, ValueError):
+        print('Error: --seed requires an integer value')
+        sys.exit(1)
+    del args[position:position + 2]
+
+if len(args) < 2:
+    print('Use: CSF_sources_analysis.py dir1 dir2 ... dirn [--seed N]')
     sys.exit(1)
 
-srcs = [s for s in sys.argv[1:]]
+srcs = [s for s in args]
 
 for src in srcs:
     if not os.path.exists(src):
@@ -51,97 +100,25 @@ for src in srcs:
         print('Please, provide a valid input')
         sys.exit(1)
 
-# -- FUNCTIONS --
-def run_conspecific(subfolder_path, log_file="conspecific_output.txt"):
-    """
-    Executes ConSpeciFix Python 2.7 using conda environment 'CSF'
-    and saves all stdout and stderr to a log file.
-    """
-
-    command = [
-        "conda", "run", "-n", "CSF",
-        "python",
-        "/home/estudiante2/JMF/ConSpeciFix/ConSpeciFix-1.3.0/database/runner_personal.py",
-        subfolder_path
-    ]
-    print(subfolder_path)
-    with open(log_file, "w") as f:  
-        try:
-            result = subprocess.run(
-                command,
-                stdout=f,         
-                stderr=subprocess.STDOUT,  
-                text=True,
-                check=True
-            )
-            print(f"ConSpeciFix finished. Output saved to {log_file}")
-
-        except subprocess.CalledProcessError as e:
-            print(f"ERROR running ConSpeciFix. Check {log_file} for details.")
-
-
-def parse_results(results_dir, genome):
-    """Parses a results.txt file from ConSpeciFix and checks whether test genome belong to same species or not"""
-    # Read results file
-    with open(results_dir, 'r') as file:
-        text = file.readlines()
-
-    # Parse text and store same species and different species
-    species = False
-    not_species = False
-
-    same_species = []
-    diff_species = []
-
-    for line in text:
-        line = line.rstrip('\n')
-
-        if line == 'The following strains are members of the species:':
-            species = True
-            continue
-
-        if line == 'The following strains were determined to NOT be a member of the species:':
-            species = False
-            not_species = True
-            continue
-
-        if species and line:
-            same_species.append(line)
-
-        if not_species and line:
-            diff_species.append(line)
-
-    print(f'\n\nProcessing test genome {genome} ...')
-
-    # Check if same species
-    if genome in same_species:
-        return True
-    else:
-        return False
-    
-def extract_and_copy_gno2(new_dir, out_dir, new_name):
-    "Searches for gno2 plot and stores it in directory results_plots with a new name"
-
-    gno2_path = os.path.join(new_dir, "_conspecifix/database/User_spec/gno2.png")
-
-    dst_path = os.path.join(out_dir, f"{new_name}")
-
-    try:
-        shutil.copy(gno2_path, dst_path)
-        print(f"Saved plot: {dst_path}")
-    except Exception as e:
-        print(f'Error copying gon2.png plot: {e}')
-
-
 # -- MAIN PROGRAM --
 
+# Results journal: a run started again with the same arguments resumes its plan
+try:
+    journal = ResultsJournal(journal_path, arguments=sys.argv[1:])  # With --seed, so other seeds start a new run
+except ValueError as e:
+    print(f'Error: {e}')
+    sys.exit(1)
+
 # Select a random test genome for each folder
 random_candidates = {}  # Dictionary with the relation random_genome (selected from source folder) 
                         # - source_index (number associated to the specific source folder)
-for idx, src in enumerate(srcs):
-    files = [f for f in os.listdir(src) if os.path.isfile(os.path.join(src, f))] # Store all files of the folder
-    random_test = random.choice(files)
-    random_candidates[random_test] = idx + 1
+if journal.jobs is None:
+    for idx, src in enumerate(srcs):
+        files = sorted(f for f in os.listdir(src) if os.path.isfile(os.path.join(src, f))) # Store all files of the folder
+        random_test = random.choice(files)
+        random_candidates[random_test] = idx + 1
+else:
+    random_candidates = journal.info["candidates"]
 
 print('The following genomes have been selected as random candidates:')
 for genome, idx in random_candidates.items():
@@ -153,67 +130,58 @@ print('')
 out_dir = "CSF_results_and_plots"
 os.makedirs(out_dir, exist_ok=True)
 
-# Execute ConSpeciFix for each test-source pair
-results_dict = {}
+# Enumerate a job for each test-source pair
+jobs = []
 
 for genome, idx in random_candidates.items():
     for element in range(len(srcs)):
         i = element + 1
         if idx != i: # Avoid evaluating each test over its own group
-            print(f'\nEvaluating genome from source folder {idx} with group {i}')
             source_folder = srcs[element]  # Source genomes path to compare
             original_folder = srcs[idx - 1] # Test genome's source group path
             genome_path = os.path.join(original_folder, genome) # Genome full path
 
-            # Create new directory
-            new_dir = f'CSF_{idx}_{i}'
-            os.makedirs(new_dir, exist_ok=True)
-            abs_path = os.path.abspath(new_dir)                        
-            # Copy genomes of source folder
-            for f in os.listdir(source_folder):
-                src_f = os.path.join(source_folder, f)
-                dst_f = os.path.join(new_dir, f)
-                if os.path.isfile(src_f):
-                    shutil.copy(src_f, dst_f)
-
-            # Copy test genome
-            shutil.copy(genome_path, os.path.join(new_dir, genome))
-
-            # Run ConSpeciFix
-            print('Runnning ConSpeciFix ...')
-            print('')
-            run_conspecific(abs_path)
-
-            # Parse results.txt file and check if test genome belongs to same species
-            results_path = os.path.join(abs_path, "results.txt")
-
-            if not os.path.isfile(results_path):
-                print("Error: no file results.txt retrieved for the analysis")
-                continue
-
-            species = parse_results(results_path, genome)
-
-            # Store results
             term = f'{idx}-{i}'
-            if species:
-                results_dict[term] = 'YES'
-            else:
-                results_dict[term] = 'NO'
-
-            # Extract results.txt gno2.png plot and store it in output folder
-            resultsname = f'{term}_results.txt'
-            results_out_path = os.path.join(out_dir, resultsname)
-            shutil.copy(results_path, results_out_path)
-
-            plotname = f'{term}_gno2.png'
-            extract_and_copy_gno2(new_dir, out_dir, plotname)
-
-            # Delete temporary folder
-            shutil.rmtree(new_dir)
-
-            print('')
-            print('')
-
+            jobs.append(CSFJob(
+                name=f'genome from source folder {idx} with group {i}',
+                test_genome=genome_path,
+                source_folder=source_folder,
+                work_dir=f'CSF_{idx}_{i}',
+                out_prefix=term,
+                keep_failed=True,
+            ))
+
+if journal.jobs is None:
+    journal.start(jobs, info={"candidates": random_candidates})
+else:
+    jobs = journal.jobs
+
+pending = journal.pending(jobs)
+if len(pending) < len(jobs):
+    print(f'Resuming {journal_path}: {len(jobs) - len(pending)} of {len(jobs)} jobs already finished')
+
+# Distant test-source pairs are inferred negatives (not run)
+if fastani_results is not None:
+    pending, pruned = prune_jobs(pending, load_matrix(fastani_results), ani_floor)
+    for job, reason in pruned:
+        journal.add(job, False, reason=reason)
+    print(f'{len(pruned)} jobs pruned by ANI (max ANI below {ani_floor}), recorded as inferred negatives\n')
+
+# Execute ConSpeciFix jobs in parallel
+run_jobs(
+    pending, out_dir, workers=workers, threads_per_job=threads_per_job,
+    memory_per_job_gb=memory_per_job_gb, total_memory_gb=total_memory_gb,
+    runner=conspecifix_runner, persistent=persistent_workers, on_result=journal.add,
+    workspace=WorkspaceManager(scratch_root, link_mode, disk_budget_gb),
+    outcome_cache=OutcomeCache(outcome_cache_path, csf_version or conspecifix_version(conspecifix_runner))
+)
+
+# Store results (derived from the journal, in job order as the serial analysis did)
+results = journal.outcomes(jobs)
+results_dict = {}
+for job, species in zip(jobs, results):
+    if species is not None:
+        results_dict[job.out_prefix] = 'YES' if species else 'NO'
 
 # Store final results
 with open('CSF_source_results.json', 'w') as file:
@@ -3,7 +3,9 @@ GTDB_processer.py
 ----------------------
 From a list of genome files, returns the GTDB taxonomic classification for each identifier. 
 Genomes are stored in a separate folder unclassified_gtdb/ if this information is not available for
-subsequent analysis with GTDBtk
+subsequent analysis with GTDBtk. GTDB API answers are cached locally (gtdb_cache.sqlite), so reruns only query
+the genomes not seen before. In offline mode the classification is read from the GTDB release files instead of
+the API
 
 Author: Jorge Marcos Fernández
 Date: 2025-11-30
@@ -11,38 +13,64 @@ Version: 1.0
 
 Usage:
     python GTDB_processer.py genomes_directory_path genomes_table_path
+    python GTDB_processer.py genomes_directory_path genomes_table_path --offline bac120_metadata.tsv[.gz] [...]
 
 Output:
     - GTDB_classification.json dictionary with the GTDB classification of each genome (if available)
     - unclassified_gtdb/ folder with genomes without available GTDB classification
+    - gtdb_cache.sqlite cache of the GTDB API answers
+    - gtdb_index.sqlite accession -> lineage index of the GTDB release files (offline mode)
 
 Dependencies:
+    - genome_registry (this repository)
+    - gtdb_client (this repository)
+    - gtdb_index (this repository)
     - json
-    - pandas
     - sys
-    - requests
     - os
     - shutil
 
 Notes:
     - Requires directory with genomes FASTAS and table with genomes identifiers (S3 from Free et al)
+    - gtdb_release labels the cache entries: change it when a new GTDB release is published to query all the
+      genomes again. Cache lifetime, workers and request rate can be changed directly in the code
+    - Offline mode accepts the bac120_metadata or bac120_taxonomy TSV files of a GTDB release (plain or gzipped).
+      They are indexed once and the index is reused while the files do not change. Entries are labelled with
+      gtdb_release
 """
 
+# To be changed by user
+gtdb_release = "R226"
+cache_path = "gtdb_cache.sqlite"
+index_path = "gtdb_index.sqlite"
+cache_ttl_days = 90             # Days a GTDB answer is reused
+negative_ttl_days = 30          # Days a "no information" answer is reused
+workers = 8                     # Concurrent GTDB API requests
+rate_limit = 5                  # Max requests per second
+
 
 # LIBRARIES
 import json
-import requests 
-import pandas as pd 
 import sys
 import os
 import shutil
 
+from genome_registry import GenomeRegistry
+from gtdb_client import GTDBClient
+from gtdb_index import GTDBIndex
+
 
 # Check arguments
-if len(sys.argv) != 3:
-    print('Use: GTDB_processer.ipynb genomes_directory_path genomes_table_path')
+if len(sys.argv) < 3 or (len(sys.argv) > 3 and (sys.argv[3] != '--offline' or len(sys.argv) == 4)):
+    print('Use: GTDB_processer.ipynb genomes_directory_path genomes_table_path [--offline GTDB_release_files ...]')
     sys.exit(1)
 
+release_files = sys.argv[4:]
+for release_file in release_files:
+    if not os.path.exists(release_file):
+        print(f'Error: GTDB release file {release_file} not found!')
+        sys.exit(1)
+
 genomes_path = sys.argv[1]
 df_path = sys.argv[2]
 
@@ -51,7 +79,7 @@ if not os.path.exists(genomes_path):
     sys.exit(1)
 
 try:
-    df = pd.read_csv(df_path, sep='\t')
+    registry = GenomeRegistry.from_table(df_path)
 except Exception as e:
     print(f'Error reading genomes table: {e}')
     sys.exit(1)
@@ -67,23 +95,31 @@ print("\nRetrieving GTDB information for genomes")
 gtdbtk_genomes = []
 gtdb_classification = {}
 
-for file in os.listdir(genomes_path):
+files = os.listdir(genomes_path)
+refseq_ids = {
+    file: str(registry.isolate(file.split('_')[0])["RefSeq Assembly (*IMG Genome ID)"]) for file in files
+}
+
+if release_files:  # Offline mode: local GTDB release index
+    index = GTDBIndex.build_or_open(index_path, release_files, gtdb_release)
+    histories = index.taxon_history(list(refseq_ids.values()))
+    index.close()
+else:
+    client = GTDBClient(
+        cache_path, gtdb_release, workers=workers, rate=rate_limit,
+        ttl_days=cache_ttl_days, negative_ttl_days=negative_ttl_days
+    )
+    histories = client.taxon_history(list(refseq_ids.values()))
+    client.close()
+    print(f'{client.hits} genomes found in {cache_path}, {client.fetched} queried to the GTDB API\n')
+
+for file in files:
 
     isolate_id = file.split('_')[0]
     name = file.replace('.fa', '')
-    refseq_id = df.loc[df["SAG or Isolate ID"] == isolate_id, "RefSeq Assembly (*IMG Genome ID)"].iloc[0]
+    data = histories[refseq_ids[file]]
 
-    url = f'https://gtdb-api.ecogenomic.org/genome/{refseq_id}/taxon-history'
-    response = requests.get(url)
-
-    if not response.ok:
-        print(f'No information found for {isolate_id}')
-        gtdbtk_genomes.append(file)
-        continue
-
-    data = response.json()
-    
-    if len(data) == 0:
+    if not data:
         print(f'No information found for {isolate_id}')
         gtdbtk_genomes.append(file)
         continue
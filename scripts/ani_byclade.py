@@ -0,0 +1,459 @@
+"""
+ani_byclade.py
+----------------------
+Inter-clade and intra-clade ANI analysis of ANI_byClade.ipynb as an importable module and script.
+Symmetric pairs (A-B and B-A) are removed with integer pair keys built from the min/max genome codes, and the
+ANI sums and counts of every clade pair are accumulated with np.bincount into a dense clade x clade matrix,
+so no step loops over the fastANI rows in Python.
+The script keeps the clade statistics (pair counts, ANI sums and sums of squares, pairs in the 83-90% gap and
+the ANI histogram) in a file next to the fastANI table. Later runs only read the fastANI rows appended since then
+and the ANI of the genomes added or removed, and the heatmap, ranges and gap fraction are produced from the stored
+statistics.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    python ani_byclade.py fastANI_results [--rebuild]
+
+    from ani_byclade import clade_matrix, matrix_clade_stats
+    from ani_loader import load_fastani
+    stats = clade_matrix(load_fastani("fastANI_results.txt"))
+    stats = matrix_clade_stats(load_matrix("fastANI_results.txt"))
+
+Output:
+    - {fastANI_results}.clade_stats.npz file with the clade statistics, updated by each run
+    - ANI_clade_pairs.tsv table with the mean ANI, standard deviation, number of genome pairs and number of pairs
+      in the ANI gap of every clade pair
+    - ANI_clade_matrix.tsv symmetric clade x clade mean ANI matrix
+    - ANI_clade_heatmap.png heatmap of the mean ANI between clades
+    - Pairwise_ANI_dist.png histogram of the ANI of all unique genome pairs (0.5% ANI bins)
+
+Dependencies:
+    - ani_matrix (this repository)
+    - numpy
+    - pandas
+    - matplotlib
+    - seaborn
+    - json
+    - os
+    - sys
+
+Notes:
+    - Clades are taken from the genome names (second field of the name split by '_'), as in the notebook.
+      Genomes without clade field are left out of the clade statistics
+    - For each A-B/B-A pair only one ANI value is used. clade_matrix keeps the first row of the fastANI table, as
+      drop_duplicates did in the notebook. The script reads the ANI matrix and uses the value with the genome
+      whose name sorts first as query (or the reverse value if fastANI only reported that one)
+    - Clade pairs are unordered, so the mean ANI of clades X-Y includes the pairs found both as X-Y and as Y-X
+    - Requires a full all-vs-all fastANI table. A table restricted to the candidate pairs of sketch_prefilter.py
+      lacks the distant pairs, which biases the means and the gap fraction towards close pairs
+    - The statistics record the table checkpoint of their last update (see ani_matrix.py). The pairs of the rows
+      appended since then (fastani_orchestrator.py --incremental) are folded in: pairs of new genomes are added, and
+      pairs between genomes already counted are replaced with their new value
+    - The statistics are computed again from scratch when the fastANI table was rewritten (not only appended to),
+      when appended rows overwrite a pair already in the table, or when genomes were removed from the table (their
+      ANI is no longer available to subtract). --rebuild forces it
+"""
+
+# To be changed by user
+ANI_th = 90             # Clade pairs sharing mean ANI >= ANI_th are reported
+gap = (83, 90)          # ANI interval whose share of genome pairs is reported
+heatmap_range = (75, 95)
+
+
+## LIBRARIES
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from ani_matrix import BLOCK_ROWS, load_matrix
+
+
+HIST_EDGES = np.arange(70, 100.5, 0.5)  # Fixed ANI histogram bins (values below 70 are counted in the first bin)
+
+
+## FUNCTIONS
+class CladeStats:
+    """
+    Persistent per clade pair ANI accumulator: genome pair counts, ANI sums, sums of squares and pairs inside the
+    ANI gap (symmetric clade x clade matrices), plus the ANI histogram and gap count of all genome pairs.
+    Records which genomes it contains and the fastANI table checkpoint it is up to date with, so it can be updated
+    with only the pairs of the appended rows and of added or removed genomes
+    """
+
+    def __init__(self, clades=()):
+        self.clades = []
+        self.sums = np.zeros((0, 0))
+        self.squares = np.zeros((0, 0))
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+        self.gap_counts = np.zeros((0, 0), dtype=np.int64)
+        self.hist = np.zeros(len(HIST_EDGES) - 1, dtype=np.int64)
+        self.total_pairs = 0
+        self.total_gap = 0
+        self.genomes = set()
+        self.checkpoint = None  # Table checkpoint of the last update (see AniMatrix.history)
+        self.clade_codes(clades)
+
+    def clade_codes(self, clades):
+        """Codes of the given clade names, adding the clades not seen before to the matrices"""
+        if set(clades) - set(self.clades):
+            # Clade list stays sorted: previous values are moved to the positions of their clades
+            all_clades = sorted(set(self.clades) | set(clades))
+            moved = np.searchsorted(all_clades, self.clades)
+            for key in ("sums", "squares", "counts", "gap_counts"):
+                old = getattr(self, key)
+                grown = np.zeros((len(all_clades), len(all_clades)), dtype=old.dtype)
+                grown[np.ix_(moved, moved)] = old
+                setattr(self, key, grown)
+            self.clades = all_clades
+
+        position = {clade: i for i, clade in enumerate(self.clades)}
+        return np.array([position[clade] for clade in clades], dtype=np.int64)
+
+    def add(self, clade1, clade2, ani, sign=1):
+        """
+        Adds (sign=1) or removes (sign=-1) genome pairs given as clade code arrays and their ANI.
+        Pairs with unknown clade (-1) only count in the histogram and gap totals
+        """
+        clade1 = np.asarray(clade1)
+        clade2 = np.asarray(clade2)
+        ani = np.asarray(ani, dtype=np.float64)
+        in_gap = (ani > gap[0]) & (ani < gap[1])
+
+        self.hist += sign * np.histogram(np.clip(ani, HIST_EDGES[0], HIST_EDGES[-1]), bins=HIST_EDGES)[0]
+        self.total_pairs += sign * len(ani)
+        self.total_gap += sign * int(np.count_nonzero(in_gap))
+
+        known = (clade1 >= 0) & (clade2 >= 0)
+        low = np.minimum(clade1[known], clade2[known])
+        high = np.maximum(clade1[known], clade2[known])
+        ani = ani[known]
+
+        n = len(self.clades)
+        keys = low * n + high
+        for key, weights in (("sums", ani), ("squares", ani ** 2), ("counts", None), ("gap_counts", in_gap[known])):
+            values = np.bincount(keys, weights=weights, minlength=n * n).reshape(n, n)
+            # Mirror the upper triangle (clade1 <= clade2) to keep the matrices symmetric
+            values = values + np.triu(values, k=1).T
+            matrix = getattr(self, key)
+            matrix += sign * values.astype(matrix.dtype)
+
+    def update(self, matrix, genomes=None):
+        """
+        Brings the accumulator to the genome pairs of an AniMatrix (see ani_matrix.py) among the given genomes
+        (default: all matrix genomes). Only the fastANI rows appended since the last update and the pairs of genomes
+        added or removed are read. Returns the number of added and removed genomes. Raises ValueError if the
+        accumulator cannot be updated (table rewritten since the last update, or genomes removed from the matrix)
+        """
+        appended = None
+        if self.genomes:
+            appended = matrix.appended_rows(self.checkpoint)
+            if appended is None:
+                raise ValueError('fastANI table rewritten since the last update, rebuild the clade statistics')
+
+        target = set(matrix.names.tolist()) if genomes is None else set(genomes) & set(matrix.names.tolist())
+        removed = self.genomes - target
+        added = target - self.genomes
+
+        lost = removed - set(matrix.names.tolist())
+        if lost:
+            raise ValueError(f'{len(lost)} genomes to remove are not in the ANI matrix, rebuild the clade statistics')
+
+        genome_clade, clades = genome_clades(matrix.names)
+        genome_clade = np.where(genome_clade >= 0, self.clade_codes(clades)[genome_clade], -1)
+
+        if appended is not None:
+            self._fold(matrix, genome_clade, *appended)
+        self._apply(matrix, genome_clade, removed, self.genomes, -1)
+        self.genomes -= removed
+        self._apply(matrix, genome_clade, added, self.genomes | added, 1)
+        self.genomes |= added
+        self.checkpoint = matrix.checkpoint()
+
+        return len(added), len(removed)
+
+    def _fold(self, matrix, genome_clade, query, reference):
+        """
+        Replaces the value of the pairs between counted genomes found in appended rows (query and reference codes).
+        Before the rows were appended their matrix values were 0 (the matrix history ends at any overwrite), so the
+        old value of each pair is the one chosen from the matrix with the appended cells set to 0
+        """
+        if not len(query) or not self.genomes:
+            return
+
+        is_member = np.zeros(len(matrix.names), dtype=bool)
+        is_member[[matrix.code(name) for name in self.genomes]] = True
+        keep = is_member[query] & is_member[reference] & (query != reference)
+        if not np.any(keep):
+            return
+
+        n = len(matrix.names)
+        cells = np.unique(query[keep] * n + reference[keep])
+        low = np.minimum(query[keep], reference[keep])
+        high = np.maximum(query[keep], reference[keep])
+        pairs = np.unique(low * n + high)
+        low, high = pairs // n, pairs % n
+
+        forward = np.asarray(matrix.values[low, high])
+        backward = np.asarray(matrix.values[high, low])
+        new = matrix.pair_values(low, high, forward, backward)
+        old = matrix.pair_values(
+            low, high,
+            np.where(np.isin(low * n + high, cells), 0, forward),
+            np.where(np.isin(high * n + low, cells), 0, backward)
+        )
+
+        for values, sign in ((old, -1), (new, 1)):
+            found = values != 0
+            self.add(genome_clade[low[found]], genome_clade[high[found]], values[found], sign)
+
+    def _apply(self, matrix, genome_clade, changed, members, sign):
+        """Adds or removes the pairs of the changed genomes with all members (pairs among changed ones once)"""
+        if not changed:
+            return
+
+        codes = np.sort([matrix.code(name) for name in changed])
+        is_member = np.zeros(len(matrix.names), dtype=bool)
+        is_member[[matrix.code(name) for name in members]] = True
+        is_changed = np.zeros(len(matrix.names), dtype=bool)
+        is_changed[codes] = True
+
+        for start in range(0, len(codes), BLOCK_ROWS):
+            block = codes[start:start + BLOCK_ROWS]
+            values = matrix.pair_rows(block)
+
+            i, j = np.nonzero(values)
+            keep = is_member[j] & (block[i] != j) & ~(is_changed[j] & (j < block[i]))
+            i, j = block[i[keep]], j[keep]
+            self.add(genome_clade[i], genome_clade[j], values[np.searchsorted(block, i), j], sign)
+
+    def means(self):
+        """Mean ANI matrix (NaN for clade pairs without any genome pair)"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts > 0, self.sums / np.maximum(self.counts, 1), np.nan)
+
+    def variances(self):
+        """ANI sample variance matrix (NaN for clade pairs with less than two genome pairs)"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = (self.squares - self.sums ** 2 / np.maximum(self.counts, 1)) / np.maximum(self.counts - 1, 1)
+            return np.where(self.counts > 1, np.maximum(variance, 0), np.nan)
+
+    def gap_fraction(self):
+        """Fraction of all genome pairs with ANI inside the gap interval"""
+        return self.total_gap / max(self.total_pairs, 1)
+
+    def mean_frame(self):
+        return pd.DataFrame(self.means(), index=self.clades, columns=self.clades)
+
+    def pair_frame(self):
+        """Long table with one row per clade pair (clade1 <= clade2) with genome pairs"""
+        i, j = np.nonzero(np.triu(self.counts > 0))
+        return pd.DataFrame({
+            "clade1": np.asarray(self.clades, dtype=object)[i],
+            "clade2": np.asarray(self.clades, dtype=object)[j],
+            "ANI": self.means()[i, j],
+            "SD": np.sqrt(self.variances()[i, j]),
+            "Pairs": self.counts[i, j],
+            "Gap pairs": self.gap_counts[i, j],
+        })
+
+    def intra(self):
+        """Mean ANI inside each clade (NaN if the clade has a single genome)"""
+        return pd.Series(np.diag(self.means()), index=self.clades, name="mean_ANI")
+
+    def inter(self):
+        """Mean ANI of every pair of different clades sharing genome pairs"""
+        pairs = self.pair_frame()
+        return pairs[pairs["clade1"] != pairs["clade2"]].reset_index(drop=True)
+
+    def save(self, path):
+        """Writes the accumulator to a .npz file (replacing it atomically)"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as file:
+            np.savez(
+                file,
+                clades=np.asarray(self.clades, dtype=str),
+                genomes=np.asarray(sorted(self.genomes), dtype=str),
+                sums=self.sums, squares=self.squares, counts=self.counts, gap_counts=self.gap_counts,
+                hist=self.hist, totals=np.array([self.total_pairs, self.total_gap]),
+                checkpoint=json.dumps(self.checkpoint),
+                params=np.array([gap[0], gap[1], HIST_EDGES[0], HIST_EDGES[-1], len(HIST_EDGES)], dtype=float),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Reads an accumulator written by save. Returns None if it is missing or was built with other settings"""
+        try:
+            with np.load(path) as data:
+                params = [gap[0], gap[1], HIST_EDGES[0], HIST_EDGES[-1], len(HIST_EDGES)]
+                if not np.allclose(data["params"], params):
+                    return None
+
+                stats = cls()
+                stats.clades = data["clades"].tolist()
+                stats.genomes = set(data["genomes"].tolist())
+                for key in ("sums", "squares", "counts", "gap_counts", "hist"):
+                    setattr(stats, key, data[key])
+                stats.total_pairs, stats.total_gap = (int(x) for x in data["totals"])
+                stats.checkpoint = json.loads(str(data["checkpoint"]))
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return stats
+
+
+def genome_clades(names, sep='_', field=1):
+    """Clade code of every genome code (-1 if its name has no clade field) and the sorted clade names"""
+    parts = [name.split(sep) for name in names]
+    raw = [p[field] if len(p) > field else None for p in parts]
+
+    clades = sorted({clade for clade in raw if clade is not None})
+    position = {clade: i for i, clade in enumerate(clades)}
+    codes = np.array([position.get(clade, -1) for clade in raw], dtype=np.int64)
+
+    return codes, clades
+
+
+def unique_pairs(table):
+    """
+    Row indices of the fastANI table with the first appearance of each unordered genome pair, without
+    self-comparisons. The pair key is min(code) * n + max(code), so A-B and B-A share the same key
+    """
+    query = np.asarray(table.query, dtype=np.int64)
+    reference = np.asarray(table.reference, dtype=np.int64)
+    rows = np.flatnonzero(query != reference)
+
+    keys = np.minimum(query[rows], reference[rows]) * len(table.names) + np.maximum(query[rows], reference[rows])
+    first = np.unique(keys, return_index=True)[1]
+
+    return np.sort(rows[first])
+
+
+def clade_matrix(table, rows=None):
+    """
+    Accumulates the ANI of the unique genome pairs (see unique_pairs) of an AniTable by clade pair.
+    Returns a CladeStats with symmetric clade x clade matrices
+    """
+    if rows is None:
+        rows = unique_pairs(table)
+
+    genome_clade, clades = genome_clades(table.names)
+    stats = CladeStats(clades)
+    stats.add(
+        genome_clade[np.asarray(table.query)[rows]],
+        genome_clade[np.asarray(table.reference)[rows]],
+        np.asarray(table.ani)[rows]
+    )
+
+    return stats
+
+
+def matrix_clade_stats(matrix):
+    """Same as clade_matrix for all the genome pairs of an AniMatrix (see ani_matrix.py), read by blocks"""
+    stats = CladeStats()
+    stats.update(matrix)
+
+    return stats
+
+
+def plot_heatmap(matrix, out_path, vmin=heatmap_range[0], vmax=heatmap_range[1]):
+    plt.figure(figsize=(8, 6))
+    sns.heatmap(
+        matrix,
+        cmap="rocket_r",
+        vmin=vmin,
+        vmax=vmax,
+        linewidths=0.5,
+        linecolor="white",
+        cbar_kws={"label": "Mean ANI (%)"}
+    )
+    plt.xlabel("")
+    plt.ylabel("")
+    plt.title("Average pairwise ANI between clades")
+    plt.tight_layout()
+    plt.savefig(out_path, dpi=300)
+    plt.close()
+
+
+def plot_distribution(stats, out_path):
+    """Histogram of the ANI of all genome pairs, from the accumulator bins"""
+    plt.figure()
+    plt.stairs(stats.hist, HIST_EDGES, fill=True, color='darkblue')
+    plt.xlabel("ANI (%)")
+    plt.ylabel("Genome pairs")
+    plt.savefig(out_path, dpi=300)
+    plt.close()
+
+
+## MAIN PROGRAM
+if __name__ == '__main__':
+
+    # Check arguments
+    args = [a for a in sys.argv[1:] if a != '--rebuild']
+    rebuild = '--rebuild' in sys.argv[1:]
+
+    if len(args) != 1:
+        print('Use: ani_byclade.py fastANI_results_file [--rebuild]')
+        sys.exit(1)
+
+    try:
+        matrix = load_matrix(args[0])
+    except Exception as e:
+        print(f'Error reading {args[0]}:{e}')
+        sys.exit(1)
+
+    # Clade statistics, updated with the genomes added or removed since the last run
+    stats_path = f'{args[0]}.clade_stats.npz'
+    stats = None if rebuild else CladeStats.load(stats_path)
+    if stats is None:
+        stats = CladeStats()
+
+    try:
+        added, removed = stats.update(matrix)
+    except ValueError as e:
+        print(f'{e}. Computing them again')
+        stats = CladeStats()
+        added, removed = stats.update(matrix)
+
+    stats.save(stats_path)
+    print(f'Clade statistics updated: {added} genomes added, {removed} removed ({stats_path})\n')
+
+    # Intra and inter-clade means
+    intra = stats.intra().dropna()
+    inter = stats.inter()
+
+    print('Intra-clade range:')
+    print(intra.max())
+    print(intra.min())
+
+    print('\nInter-clade range:')
+    print(inter["ANI"].max())
+    print(inter["ANI"].min())
+
+    close = inter[inter["ANI"] >= ANI_th]
+    print(f'\n{len(close)} pairs of different clades share mean ANI >= {ANI_th}')
+    for _, row in close.iterrows():
+        print(f'\t{row["clade1"]} - {row["clade2"]}: {row["ANI"]:.2f}')
+
+    # Share of genome pairs in the ANI gap
+    perc = stats.gap_fraction() * 100
+    print(f'\n{round(perc, 2)} % of the genome pairs have {gap[0]} < ANI < {gap[1]}')
+
+    # Output
+    stats.pair_frame().to_csv("ANI_clade_pairs.tsv", sep='\t', index=False)
+    stats.mean_frame().to_csv("ANI_clade_matrix.tsv", sep='\t')
+    plot_heatmap(stats.mean_frame(), "ANI_clade_heatmap.png")
+    plot_distribution(stats, "Pairwise_ANI_dist.png")
+
+    print('\nAnalysis completed! Results are available in ANI_clade_pairs.tsv, ANI_clade_matrix.tsv, '
+          'ANI_clade_heatmap.png and Pairwise_ANI_dist.png')
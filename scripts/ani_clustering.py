@@ -0,0 +1,167 @@
+"""
+ani_clustering.py
+----------------------
+Vectorised ANI clustering engine shared by ANI_grouping.py and summary_table.py.
+Genome names are coded as integers and the genomes sharing ANI >= threshold are grouped (single linkage) by
+running connected components on NumPy edge arrays, instead of adding one networkx edge per fastANI row.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from ani_clustering import ani_components, table_components
+    components = ani_components(df["Query"], df["Reference"], df["ANI"], 95)
+    components = table_components(load_fastani("fastANI_results.txt"), 95)
+    components = matrix_components(load_matrix("fastANI_results.txt"), 95)
+    thresholds, labels = threshold_sweep(load_fastani("fastANI_results.txt"), [95, 96, 97])
+
+Dependencies:
+    - numpy
+    - pandas
+
+Notes:
+    - Groups are identical to the connected components of the networkx graph built by the previous code:
+      only genomes with at least one pair ANI >= threshold (self-comparisons excluded) are included
+    - Components are returned sorted by size (ascending). Components of the same size are ordered by the first
+      appearance of their genomes in the table, so the output is reproducible between runs
+"""
+
+## LIBRARIES
+import numpy as np
+import pandas as pd
+
+
+## FUNCTIONS
+def connected_components(src, dst, n_nodes):
+    """
+    Labels each node with the smallest node code of its connected component, for the undirected edges src-dst.
+    Array-backed union-find: every round hooks the larger root of each crossing edge onto the smaller one and
+    then compresses all paths at once (pointer jumping)
+    """
+    labels = np.arange(n_nodes, dtype=np.int64)
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+
+    while len(src):
+        root_src = labels[src]
+        root_dst = labels[dst]
+        crossing = root_src != root_dst
+        if not crossing.any():
+            break
+
+        # Edges already inside a component never cross again
+        src, dst = src[crossing], dst[crossing]
+        root_src, root_dst = root_src[crossing], root_dst[crossing]
+
+        np.minimum.at(labels, np.maximum(root_src, root_dst), np.minimum(root_src, root_dst))
+
+        while True:
+            parents = labels[labels]
+            if np.array_equal(parents, labels):
+                break
+            labels = parents
+
+    return labels
+
+
+def group_nodes(nodes, node_labels):
+    """Splits node codes into arrays sharing the same label, ordered by label"""
+    if len(nodes) == 0:
+        return []
+
+    order = np.argsort(node_labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(node_labels[order])) + 1
+
+    return np.split(nodes[order], bounds)
+
+
+def code_components(q_codes, r_codes, ani, threshold, n_nodes):
+    """Connected components (arrays of node codes) of the pairs with ANI >= threshold, excluding self-pairs"""
+    mask = (ani >= threshold) & (q_codes != r_codes)
+    src, dst = q_codes[mask], r_codes[mask]
+
+    labels = connected_components(src, dst, n_nodes)
+    nodes = np.unique(np.concatenate([src, dst]))
+
+    return group_nodes(nodes, labels[nodes])
+
+
+def ani_components(query, reference, ani, threshold):
+    """
+    Groups genomes sharing ANI >= threshold. Takes the Query, Reference and ANI columns of a fastANI table and
+    returns the components as sets of genome names, sorted by size (ascending)
+    """
+    n_pairs = len(query)
+    codes, names = pd.factorize(np.concatenate([np.asarray(query), np.asarray(reference)]))
+    q_codes, r_codes = codes[:n_pairs], codes[n_pairs:]
+
+    groups = code_components(q_codes, r_codes, np.asarray(ani, dtype=float), float(threshold), len(names))
+    names = np.asarray(names, dtype=object)
+
+    return sorted((set(names[group].tolist()) for group in groups), key=len)
+
+
+def table_components(table, threshold):
+    """Same as ani_components for an AniTable (see ani_loader.py), whose genomes are already integer-coded"""
+    groups = code_components(
+        np.asarray(table.query), np.asarray(table.reference), np.asarray(table.ani), threshold, len(table.names)
+    )
+
+    return sorted((set(table.names[group].tolist()) for group in groups), key=len)
+
+
+def matrix_components(matrix, threshold):
+    """Same as table_components for an AniMatrix (see ani_matrix.py), read block by block from the memory map"""
+    src, dst = matrix.edges(threshold)
+    labels = connected_components(src, dst, len(matrix.names))
+    nodes = np.unique(np.concatenate([src, dst]))
+
+    return sorted((set(matrix.names[group].tolist()) for group in group_nodes(nodes, labels[nodes])), key=len)
+
+
+def threshold_sweep(table, thresholds):
+    """
+    Single-pass multi-threshold clustering of an AniTable. Pairs are sorted by ANI once and added in decreasing
+    ANI order (Kruskal-style), so each threshold only merges the components of the pairs not seen before.
+    Returns the thresholds (descending) and an array of component labels with one row per threshold and one
+    column per genome. Genomes without any pair >= threshold are labelled -1, as they belong to no component
+    """
+    query = np.asarray(table.query)
+    reference = np.asarray(table.reference)
+    ani = np.asarray(table.ani)
+    n_nodes = len(table.names)
+
+    not_self = query != reference
+    order = np.argsort(-ani[not_self], kind='stable')
+    src = query[not_self][order]
+    dst = reference[not_self][order]
+    sorted_ani = ani[not_self][order]
+
+    thresholds = sorted(set(float(t) for t in thresholds), reverse=True)
+    labels = np.arange(n_nodes, dtype=np.int64)
+    grouped = np.zeros(n_nodes, dtype=bool)
+    sweep = np.empty((len(thresholds), n_nodes), dtype=np.int64)
+    start = 0
+
+    for i, threshold in enumerate(thresholds):
+        # Pairs with threshold <= ANI < previous threshold (sorted_ani is decreasing)
+        # Threshold in the ANI dtype (float32), so that ANI == threshold pairs are kept as in code_components
+        end = int(np.searchsorted(-sorted_ani, -sorted_ani.dtype.type(threshold), side='right'))
+        new_src, new_dst = src[start:end], dst[start:end]
+        start = end
+
+        # Components of the graph contracted by the previous threshold: only roots take part
+        roots = connected_components(labels[new_src], labels[new_dst], n_nodes)
+        labels = roots[labels]
+
+        grouped[new_src] = True
+        grouped[new_dst] = True
+        sweep[i] = np.where(grouped, labels, -1)
+
+    return thresholds, sweep
+
+
+def membership(components):
+    """{genome: component index} dictionary of a list of components"""
+    return {genome: i for i, component in enumerate(components) for genome in component}
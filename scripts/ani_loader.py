@@ -0,0 +1,252 @@
+"""
+ani_loader.py
+----------------------
+Shared fastANI results loader used by ANI_grouping.py, summary_table.py and the clade ANI analysis.
+The fastANI table is read in chunks, genome names are normalised once (basename without FASTA extension) and
+stored as integer codes with a name list, ANI as float32 and fragment counts as small integers.
+A binary cache is written next to the table, so later loads memory-map it instead of parsing the text again.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from ani_loader import load_fastani
+    table = load_fastani("fastANI_results.txt")
+    table.names[table.query[0]], table.ani[0]
+
+Output:
+    - {fastANI_results}.cache/ folder with query.npy, reference.npy, ani.npy, mappings.npy, fragments.npy,
+      names.txt and source.json (size and modification time of the table it was built from)
+
+Dependencies:
+    - genome_store (this repository)
+    - numpy
+    - pandas
+    - hashlib
+    - io
+    - json
+    - os
+    - shutil
+
+Notes:
+    - The cache is rebuilt automatically when the fastANI table changes (different size or modification time)
+    - Names no longer depend on the folder fastANI was run from, so full_dir does not need to be set
+    - table_checkpoint gives the size and SHA-256 of a table, and tells whether it only had rows appended since an
+      earlier checkpoint (fastani_orchestrator.py --incremental), so that only the rows after it need to be read
+"""
+
+## LIBRARIES
+import hashlib
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from genome_store import genome_name
+
+
+COLNAMES = ["Query", "Reference", "ANI", "Bidirectional mappings", "Query fragments"]
+ARRAYS = ("query", "reference", "ani", "mappings", "fragments")
+CHUNK_ROWS = 2_000_000
+CHUNK_BYTES = 1 << 20
+
+
+## FUNCTIONS
+class AniTable:
+    """fastANI results as integer-coded genome pairs with compact columns"""
+
+    def __init__(self, names, query, reference, ani, mappings, fragments):
+        self.names = np.asarray(names, dtype=object)
+        self.query = query
+        self.reference = reference
+        self.ani = ani
+        self.mappings = mappings
+        self.fragments = fragments
+        self.index = {name: code for code, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.ani)
+
+    def code(self, name):
+        """Integer code of a genome name. Raises KeyError if the genome is not in the table"""
+        return self.index[name]
+
+    def to_frame(self):
+        """DataFrame with the original column names. Query and Reference are categorical columns"""
+        categories = pd.Index(self.names)
+        return pd.DataFrame({
+            "Query": pd.Categorical.from_codes(self.query, categories),
+            "Reference": pd.Categorical.from_codes(self.reference, categories),
+            "ANI": self.ani,
+            "Bidirectional mappings": self.mappings,
+            "Query fragments": self.fragments,
+        })
+
+
+def small_int(values):
+    """Smallest unsigned integer array able to hold the fragment counts"""
+    values = np.asarray(values)
+    if len(values) == 0 or values.max() <= np.iinfo(np.uint16).max:
+        return values.astype(np.uint16)
+
+    return values.astype(np.uint32)
+
+
+def cache_path(path):
+    return f'{path}.cache'
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def table_checkpoint(path, previous=None):
+    """
+    Checkpoint of a fastANI table, {size, sha256}, computed in one sequential read without parsing. Returns
+    (checkpoint, extends): extends is True if the table starts with the exact bytes the previous checkpoint was
+    taken from (rows were only appended since). The checkpoint is None if the table ends with a partial line
+    """
+    digest = hashlib.sha256()
+    extends = False
+    last = b'\n'
+
+    with open(path, 'rb') as file:
+        if previous is not None:
+            remaining = previous["size"]
+            while remaining:
+                chunk = file.read(min(CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+                last = chunk[-1:]
+            extends = remaining == 0 and digest.hexdigest() == previous["sha256"]
+
+        for chunk in iter(lambda: file.read(CHUNK_BYTES), b''):
+            digest.update(chunk)
+            last = chunk[-1:]
+        size = file.tell()
+
+    checkpoint = {"size": size, "sha256": digest.hexdigest()} if last == b'\n' else None
+
+    return checkpoint, extends
+
+
+def read_fastani(path, chunk_rows=CHUNK_ROWS, offset=0, end=None):
+    """
+    Parses a fastANI output table in chunks into an AniTable. offset and end (byte positions at line starts)
+    restrict it to the rows in between, e.g. the rows appended after a checkpoint
+    """
+    source = path
+    if offset or end is not None:
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            source = io.BytesIO(file.read(-1 if end is None else end - offset))
+
+    codes = {}      # Normalised genome name -> code
+    names = []
+    path_codes = {} # Raw fastANI path -> code, so each path is normalised only once
+    columns = {key: [] for key in ARRAYS}
+
+    def encode(values):
+        chunk_codes, uniques = pd.factorize(values)
+        lookup = np.empty(len(uniques), dtype=np.int32)
+        for i, raw in enumerate(uniques):
+            if raw not in path_codes:
+                name = genome_name(raw)
+                if name not in codes:
+                    codes[name] = len(names)
+                    names.append(name)
+                path_codes[raw] = codes[name]
+            lookup[i] = path_codes[raw]
+
+        return lookup[chunk_codes]
+
+    try:
+        reader = pd.read_csv(
+            source, sep='\t', names=COLNAMES, header=None, chunksize=chunk_rows,
+            dtype={"Query": str, "Reference": str, "ANI": np.float32,
+                   "Bidirectional mappings": np.int64, "Query fragments": np.int64}
+        )
+    except pd.errors.EmptyDataError:  # No rows
+        reader = []
+    for chunk in reader:
+        columns["query"].append(encode(chunk["Query"]))
+        columns["reference"].append(encode(chunk["Reference"]))
+        columns["ani"].append(chunk["ANI"].to_numpy(dtype=np.float32))
+        columns["mappings"].append(chunk["Bidirectional mappings"].to_numpy())
+        columns["fragments"].append(chunk["Query fragments"].to_numpy())
+
+    def join(key, dtype):
+        return np.concatenate(columns[key]).astype(dtype) if columns[key] else np.empty(0, dtype=dtype)
+
+    return AniTable(
+        names,
+        join("query", np.int32),
+        join("reference", np.int32),
+        join("ani", np.float32),
+        small_int(join("mappings", np.int64)),
+        small_int(join("fragments", np.int64)),
+    )
+
+
+def write_cache(table, path):
+    """Writes the binary cache of a fastANI table (replacing any previous one)"""
+    out_dir = cache_path(path)
+    tmp_dir = f'{out_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    for key in ARRAYS:
+        np.save(os.path.join(tmp_dir, f'{key}.npy'), getattr(table, key))
+
+    with open(os.path.join(tmp_dir, 'names.txt'), 'w') as file:
+        for name in table.names:
+            file.write(f'{name}\n')
+
+    with open(os.path.join(tmp_dir, 'source.json'), 'w') as file:
+        json.dump(source_signature(path), file)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+
+
+def read_cache(path):
+    """Memory-maps the binary cache of a fastANI table. Returns None if it is missing or outdated"""
+    in_dir = cache_path(path)
+    try:
+        with open(os.path.join(in_dir, 'source.json'), 'r') as file:
+            if json.load(file) != source_signature(path):
+                return None
+
+        with open(os.path.join(in_dir, 'names.txt'), 'r') as file:
+            names = [line.rstrip('\n') for line in file]
+
+        arrays = [np.load(os.path.join(in_dir, f'{key}.npy'), mmap_mode='r') for key in ARRAYS]
+    except (OSError, ValueError):
+        return None
+
+    return AniTable(names, *arrays)
+
+
+def load_fastani(path, use_cache=True):
+    """Loads a fastANI table, from its binary cache when it is up to date"""
+    if use_cache:
+        table = read_cache(path)
+        if table is not None:
+            return table
+
+    table = read_fastani(path)
+
+    if use_cache:
+        try:
+            write_cache(table, path)
+        except OSError as e:
+            print(f'Warning: could not write ANI cache for {path}: {e}')
+
+    return table
@@ -0,0 +1,294 @@
+"""
+ani_matrix.py
+----------------------
+Dense ANI matrix shared by ANI_grouping.py, summary_table.py and ani_byclade.py. The fastANI table is converted
+once into a float32 N x N matrix (row = query genome, column = reference genome) saved as a .npy file next to it,
+with the genome names in matrix order. Later reads memory-map the file, so a pair lookup is a single array access,
+a genome's row is a slice, and several processes reading the same matrix share it through the page cache.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from ani_matrix import load_matrix
+    matrix = load_matrix("fastANI_results.txt")
+    matrix.lookup("genome_A", "genome_B"), matrix.row("genome_A"), matrix.neighbours("genome_A", 95)
+
+Output:
+    - {fastANI_results}.matrix/ folder with ani.npy (N x N float32), names.txt and source.json (size and
+      modification time of the table it was built from, and the checkpoints of the table since the matrix was built)
+
+Dependencies:
+    - ani_loader (this repository)
+    - numpy
+    - json
+    - os
+    - shutil
+
+Notes:
+    - The matrix keeps the direction of fastANI results: lookup(A, B) is the ANI with A as query and B as reference
+    - Pairs missing from the table (not computed, or below the ~80% ANI fastANI reports) are stored as 0
+    - The matrix is updated automatically when the fastANI table changes (different size or modification time).
+      Its size is 4 * N^2 bytes (about 100 MB for 5000 genomes)
+    - If rows were only appended to the table (see ani_loader.table_checkpoint), only those rows are read and the
+      matrix is extended with them. Otherwise it is rebuilt from the whole table
+    - The matrix history lists the table checkpoints it went through by appends only, so appended_rows can give
+      the rows added since any of them. Appended rows that overwrite a value already in the matrix (a pair computed
+      twice) restart the history, as a rewritten table does
+"""
+
+## LIBRARIES
+import json
+import os
+import shutil
+
+import numpy as np
+
+from ani_loader import load_fastani, read_fastani, source_signature, table_checkpoint
+
+
+BLOCK_ROWS = 1024   # Rows read at once when scanning the whole matrix
+
+
+## FUNCTIONS
+class AniMatrix:
+    """Directional genome x genome ANI matrix (0 = no fastANI result) with a genome name index"""
+
+    def __init__(self, names, values, path=None, history=()):
+        self.names = np.asarray(names, dtype=object)
+        self.values = values
+        self.index = {name: code for code, name in enumerate(self.names)}
+        self.name_rank = np.argsort(np.argsort(self.names.astype(str), kind='stable'))
+        self.path = path                # fastANI table of the matrix
+        self.history = list(history)    # Table checkpoints reached by appends only, the last one is the current
+
+    def __len__(self):
+        return len(self.names)
+
+    def code(self, name):
+        """Integer code (row and column) of a genome name. Raises KeyError if the genome is not in the matrix"""
+        return self.index[name]
+
+    def lookup(self, query, reference):
+        """ANI of the query -> reference pair (0.0 if fastANI did not report it)"""
+        return float(self.values[self.index[query], self.index[reference]])
+
+    def row(self, name):
+        """ANI of a genome (as query) against every genome, in matrix order"""
+        return self.values[self.index[name]]
+
+    def neighbours(self, name, threshold):
+        """Names of the genomes with ANI >= threshold against the given genome (as query), itself excluded"""
+        code = self.index[name]
+        hits = np.flatnonzero(self.values[code] >= threshold)
+        return self.names[hits[hits != code]].tolist()
+
+    def blocks(self, block_rows=BLOCK_ROWS):
+        """Yields (first row, rows) blocks of the matrix"""
+        for start in range(0, len(self.names), block_rows):
+            yield start, np.asarray(self.values[start:start + block_rows])
+
+    def queried(self):
+        """Boolean array with the genomes that have results as query"""
+        found = np.zeros(len(self.names), dtype=bool)
+        for start, rows in self.blocks():
+            found[start:start + len(rows)] = (rows != 0).any(axis=1)
+        return found
+
+    def edges(self, threshold):
+        """Query and reference codes of the pairs with ANI >= threshold, self-pairs excluded"""
+        src, dst = [], []
+        for start, rows in self.blocks():
+            i, j = np.nonzero(rows >= threshold)
+            i += start
+            src.append(i[i != j])
+            dst.append(j[i != j])
+
+        if not src:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(src), np.concatenate(dst)
+
+    def pair_rows(self, codes):
+        """
+        ANI of the given genomes against every genome with one value per unordered pair: the value with the genome
+        whose name sorts first as query, or the reverse value if fastANI only reported that one (0 = no result).
+        The choice does not depend on matrix order, so it is the same after the matrix is rebuilt
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        forward = np.asarray(self.values[codes])
+        backward = np.asarray(self.values[:, codes]).T
+
+        first = self.name_rank[codes][:, None] < self.name_rank[None, :]
+        preferred = np.where(first, forward, backward)
+        other = np.where(first, backward, forward)
+
+        return np.where(preferred != 0, preferred, other)
+
+    def pair_values(self, i, j, forward=None, backward=None):
+        """
+        One value per unordered pair (i[k], j[k]) chosen as in pair_rows, from the matrix or from the given
+        forward (i -> j) and backward (j -> i) values
+        """
+        forward = np.asarray(self.values[i, j]) if forward is None else forward
+        backward = np.asarray(self.values[j, i]) if backward is None else backward
+
+        first = self.name_rank[i] < self.name_rank[j]
+        preferred = np.where(first, forward, backward)
+        other = np.where(first, backward, forward)
+
+        return np.where(preferred != 0, preferred, other)
+
+    def checkpoint(self):
+        """Checkpoint of the table the matrix is up to date with (None if unknown)"""
+        return self.history[-1] if self.history else None
+
+    def appended_rows(self, checkpoint):
+        """
+        Query and reference codes of the fastANI rows appended to the table since a checkpoint of the matrix
+        history. Returns None if the checkpoint is not in the history (table rewritten or matrix rebuilt since)
+        """
+        if checkpoint is None or checkpoint not in self.history:
+            return None
+
+        empty = np.empty(0, dtype=np.int64)
+        if checkpoint == self.history[-1]:
+            return empty, empty
+
+        rows = read_fastani(self.path, offset=checkpoint["size"], end=self.history[-1]["size"])
+        codes = np.array([self.index[name] for name in rows.names], dtype=np.int64)
+
+        return codes[rows.query], codes[rows.reference]
+
+    def pairs(self):
+        """Yields (i, j, ANI) arrays with one value per unordered genome pair (i < j) with results (see pair_rows)"""
+        for start in range(0, len(self.names), BLOCK_ROWS):
+            codes = np.arange(start, min(start + BLOCK_ROWS, len(self.names)))
+            values = self.pair_rows(codes)
+
+            i, j = np.nonzero(values)
+            upper = codes[i] < j
+            i, j = i[upper], j[upper]
+            yield codes[i], j, values[i, j]
+
+
+def matrix_path(path):
+    return f'{path}.matrix'
+
+
+def fill_matrix(table, values):
+    """Writes the ANI of every row of an AniTable into a zeroed N x N array"""
+    values[np.asarray(table.query), np.asarray(table.reference)] = np.asarray(table.ani)
+
+
+def write_matrix(path, names, fill, history):
+    """
+    Writes the matrix folder of the fastANI table at path: fill(values) writes the ANI into the zeroed N x N array.
+    The folder is replaced atomically
+    """
+    out_dir = matrix_path(path)
+    tmp_dir = f'{out_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    n = len(names)
+    values = np.lib.format.open_memmap(os.path.join(tmp_dir, 'ani.npy'), mode='w+', dtype=np.float32, shape=(n, n))
+    fill(values)
+    values.flush()
+    del values
+
+    with open(os.path.join(tmp_dir, 'names.txt'), 'w') as file:
+        for name in names:
+            file.write(f'{name}\n')
+
+    with open(os.path.join(tmp_dir, 'source.json'), 'w') as file:
+        json.dump(dict(source_signature(path), history=history), file)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+
+
+def build_matrix(table, path, history=()):
+    """Writes the ANI matrix of an AniTable (see ani_loader.py) built from the fastANI table at path"""
+    write_matrix(path, table.names, lambda values: fill_matrix(table, values), list(history))
+
+
+def extend_matrix(matrix, path):
+    """
+    Extends an outdated matrix with the rows appended to its fastANI table since its last checkpoint. Returns False
+    (nothing written) if the table was not only appended to
+    """
+    previous = matrix.checkpoint()
+    if previous is None:
+        return False
+    checkpoint, extends = table_checkpoint(path, previous)
+    if not extends or checkpoint is None:
+        return False
+
+    rows = read_fastani(path, offset=previous["size"], end=checkpoint["size"])
+    names = matrix.names.tolist() + [name for name in rows.names if name not in matrix.index]
+    position = {name: code for code, name in enumerate(names)}
+    codes = np.array([position[name] for name in rows.names], dtype=np.int64)
+    query, reference = codes[rows.query], codes[rows.reference]
+    known = (query < len(matrix.names)) & (reference < len(matrix.names))
+    overwrites = bool(np.any(np.asarray(matrix.values[query[known], reference[known]]) != 0))
+
+    def fill(values):
+        for start, block in matrix.blocks():
+            values[start:start + len(block), :len(matrix.names)] = block
+        values[query, reference] = np.asarray(rows.ani)
+
+    write_matrix(path, names, fill, [checkpoint] if overwrites else matrix.history + [checkpoint])
+    print(f'ANI matrix extended with {len(rows)} appended rows ({len(names) - len(matrix.names)} new genomes)')
+
+    return True
+
+
+def read_matrix(path, current=True):
+    """
+    Memory-maps the ANI matrix of a fastANI table. Returns None if it is missing, or outdated unless current=False
+    """
+    in_dir = matrix_path(path)
+    try:
+        with open(os.path.join(in_dir, 'source.json'), 'r') as file:
+            source = json.load(file)
+        if current and {key: source.get(key) for key in ("size", "mtime_ns")} != source_signature(path):
+            return None
+
+        with open(os.path.join(in_dir, 'names.txt'), 'r') as file:
+            names = [line.rstrip('\n') for line in file]
+
+        values = np.load(os.path.join(in_dir, 'ani.npy'), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+    return AniMatrix(names, values, path, source.get("history", []))
+
+
+def load_matrix(path):
+    """
+    Loads the ANI matrix of a fastANI table. An outdated matrix is extended with the appended rows of the table,
+    or built again from the whole table if it was rewritten
+    """
+    matrix = read_matrix(path)
+    if matrix is not None:
+        return matrix
+
+    outdated = read_matrix(path, current=False)
+    try:
+        if outdated is not None and extend_matrix(outdated, path):
+            return read_matrix(path)
+    except OSError as e:
+        print(f'Warning: could not extend ANI matrix for {path}: {e}')
+
+    checkpoint, _ = table_checkpoint(path)
+    table = load_fastani(path)
+    try:
+        build_matrix(table, path, [checkpoint] if checkpoint is not None else [])
+    except OSError as e:
+        print(f'Warning: could not write ANI matrix for {path}: {e}')
+        values = np.zeros((len(table.names), len(table.names)), dtype=np.float32)
+        fill_matrix(table, values)
+        return AniMatrix(table.names, values, path)
+
+    return read_matrix(path)
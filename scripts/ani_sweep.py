@@ -0,0 +1,116 @@
+"""
+ani_sweep.py
+----------------------
+Clusters genomes by ANI at many thresholds in a single pass over the fastANI table, to see how species groups
+change with the threshold without running ANI_grouping.py once per value.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    python ani_sweep.py fastANI_results ANI_th1 [ANI_th2 ... ANI_thn]
+    python ani_sweep.py fastANI_results start:stop:step
+
+Output:
+    - ANI_sweep_clusters.tsv table with one row per genome and one column per threshold. Groups are numbered by size
+      (1 is the largest group at that threshold) and 0 means the genome shares no pair >= threshold with other genome
+    - ANI_sweep_sources.tsv table with the size of every group with >= 15 genomes (source groups) at each threshold
+
+Dependencies:
+    - ani_clustering (this repository)
+    - ani_loader (this repository)
+    - numpy
+    - pandas
+    - sys
+
+Notes:
+    - Groups at each threshold are the same ones ANI_grouping.py finds with that threshold
+    - Ranges (start:stop:step) include the stop value
+"""
+
+# To be changed by user
+min_source_size = 15
+
+
+## LIBRARIES
+import sys
+
+import numpy as np
+import pandas as pd
+
+from ani_clustering import threshold_sweep
+from ani_loader import load_fastani
+
+
+## FUNCTIONS
+def parse_thresholds(args):
+    """Reads thresholds given as values or start:stop:step ranges"""
+    thresholds = []
+    for arg in args:
+        if ':' in arg:
+            start, stop, step = (float(x) for x in arg.split(':'))
+            thresholds += np.arange(start, stop + step / 2, step).round(6).tolist()
+        else:
+            thresholds.append(float(arg))
+
+    return thresholds
+
+
+def number_groups(labels):
+    """Renumbers the component labels of one threshold by decreasing group size (1 = largest, 0 = no group)"""
+    numbers = np.zeros(len(labels), dtype=np.int64)
+    grouped = labels >= 0
+    if not grouped.any():
+        return numbers, np.empty(0, dtype=np.int64)
+
+    uniques, inverse, sizes = np.unique(labels[grouped], return_inverse=True, return_counts=True)
+    order = np.argsort(-sizes, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(1, len(order) + 1)
+    numbers[grouped] = rank[inverse]
+
+    return numbers, sizes[order]
+
+
+## CHECK ARGUMENTS
+args = sys.argv
+if len(args) < 3:
+    print('Use: ani_sweep.py fastANI_results_file ANI_th1 [ANI_th2 ... ANI_thn | start:stop:step]')
+    sys.exit(1)
+
+try:
+    thresholds = parse_thresholds(args[2:])
+except ValueError:
+    print(f'Error: invalid ANI thresholds: {" ".join(args[2:])}')
+    sys.exit(1)
+
+try:
+    table = load_fastani(args[1])
+except Exception as e:
+    print(f'Error reading {args[1]}:{e}')
+    sys.exit(1)
+
+
+## SWEEP
+thresholds, sweep = threshold_sweep(table, thresholds)
+
+clusters = {"Genome": table.names}
+sources = []
+
+for threshold, labels in zip(thresholds, sweep):
+    numbers, sizes = number_groups(labels)
+    clusters[f'{threshold:g}'] = numbers
+
+    big = sizes[sizes >= min_source_size]
+    for i, size in enumerate(big):
+        sources.append({"Threshold": threshold, "Group": i + 1, "Size": int(size)})
+
+    print(f'ANI >= {threshold:g}: {len(sizes)} groups, {len(big)} with >= {min_source_size} genomes {big.tolist()}')
+
+
+## OUTPUT
+pd.DataFrame(clusters).sort_values("Genome").to_csv("ANI_sweep_clusters.tsv", sep='\t', index=False)
+pd.DataFrame(sources, columns=["Threshold", "Group", "Size"]).to_csv("ANI_sweep_sources.tsv", sep='\t', index=False)
+
+print('\nAnalysis completed! Results are available in ANI_sweep_clusters.tsv and ANI_sweep_sources.tsv')
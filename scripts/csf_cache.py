@@ -0,0 +1,148 @@
+"""
+csf_cache.py
+----------------------
+Content-addressed cache of the ConSpeciFix stage used by csf_scheduler.py.
+OutcomeCache keeps the outcome, results.txt and gno2.png of every finished job in SQLite, keyed by the content hash
+of the test genome, the hash of the source set and the ConSpeciFix version, so repeated comparisons are not run again.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from csf_cache import OutcomeCache, conspecifix_version
+    outcomes = OutcomeCache("CSF_outcomes.sqlite", conspecifix_version(runner))
+    results = run_jobs(jobs, "CSF_results_and_plots", outcome_cache=outcomes)
+
+Output:
+    - SQLite outcome cache file (table outcomes)
+
+Dependencies:
+    - hashlib
+    - os
+    - re
+    - sqlite3
+    - time
+
+Notes:
+    - Not meant to be run directly, it is imported by csf_scheduler.py and the CSF analysis scripts
+    - The source set hash only depends on the genome file names and contents, so renamed or moved source folders
+      with the same genomes share their outcomes, and any change in a genome gives a new key
+    - Outcomes are keyed by genome contents, so a cached results.txt may list the test genome under the file name
+      it had when it was run. The species outcome stored is the one parsed for that run
+"""
+
+## LIBRARIES
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+
+CHUNK = 1 << 20
+
+
+## FUNCTIONS
+def file_hash(path):
+    """SHA-256 of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def source_files(folder):
+    return sorted(f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f)))
+
+
+def source_set_hash(folder):
+    """SHA-256 of the (file name, content hash) list of the genomes of a source group"""
+    digest = hashlib.sha256()
+    for name in source_files(folder):
+        digest.update(f'{name}\t{file_hash(os.path.join(folder, name))}\n'.encode())
+
+    return digest.hexdigest()
+
+
+def conspecifix_version(runner):
+    """
+    Version tag of a ConSpeciFix runner: the release in its installation path (ConSpeciFix-1.3.0) and the hash of
+    the runner script, so that a modified runner does not reuse older outcomes
+    """
+    match = re.search(r'ConSpeciFix-([\d.]+)', os.path.realpath(runner))
+    release = match.group(1) if match else 'unknown'
+    runner_hash = file_hash(runner)[:12] if os.path.isfile(runner) else 'missing'
+
+    return f'{release}:{runner_hash}'
+
+
+class OutcomeCache:
+    """SQLite cache of ConSpeciFix outcomes keyed by (test genome hash, source set hash, ConSpeciFix version)"""
+
+    def __init__(self, path, version):
+        self.connection = sqlite3.connect(path)
+        self.version = version
+        self.hashes = {}  # Genome file or source folder -> content hash (hashed once per run)
+        self.hits = 0
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS outcomes ('
+            'genome_hash TEXT NOT NULL, source_hash TEXT NOT NULL, version TEXT NOT NULL, species INTEGER NOT NULL, '
+            'results TEXT NOT NULL, gno2 BLOB, genome TEXT NOT NULL, source_folder TEXT NOT NULL, '
+            'stored REAL NOT NULL, PRIMARY KEY (genome_hash, source_hash, version))'
+        )
+        self.connection.commit()
+
+    def key(self, job):
+        """Cache key of a job"""
+        genome = os.path.abspath(job.test_genome)
+        folder = os.path.abspath(job.source_folder)
+        if genome not in self.hashes:
+            self.hashes[genome] = file_hash(genome)
+        if folder not in self.hashes:
+            self.hashes[folder] = source_set_hash(folder)
+
+        return self.hashes[genome], self.hashes[folder], self.version
+
+    def restore(self, job, out_dir):
+        """
+        Cached outcome of a job (True / False), writing its results.txt and gno2 plot to the output folder as the
+        job would. None if the comparison was never run
+        """
+        row = self.connection.execute(
+            'SELECT species, results, gno2 FROM outcomes WHERE genome_hash = ? AND source_hash = ? AND version = ?',
+            self.key(job)
+        ).fetchone()
+        if row is None:
+            return None
+
+        with open(os.path.join(out_dir, f'{job.out_prefix}_results.txt'), 'w') as file:
+            file.write(row[1])
+        if row[2] is not None:
+            with open(os.path.join(out_dir, f'{job.out_prefix}_gno2.png'), 'wb') as file:
+                file.write(row[2])
+        self.hits += 1
+
+        return bool(row[0])
+
+    def store(self, job, species, out_dir):
+        """Stores the outcome of a finished job with the results files it copied to the output folder"""
+        with open(os.path.join(out_dir, f'{job.out_prefix}_results.txt'), 'r') as file:
+            results = file.read()
+        gno2 = None
+        gno2_path = os.path.join(out_dir, f'{job.out_prefix}_gno2.png')
+        if os.path.isfile(gno2_path):
+            with open(gno2_path, 'rb') as file:
+                gno2 = file.read()
+
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (*self.key(job), int(species), results, gno2, job.genome, os.path.abspath(job.source_folder),
+                 time.time())
+            )
+
+    def close(self):
+        self.connection.close()
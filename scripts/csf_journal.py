@@ -0,0 +1,130 @@
+"""
+csf_journal.py
+----------------------
+Append-only results journal of the CSF analysis scripts. The journal starts with the plan of the run (the jobs
+enumerated, with the randomly selected test genomes) and gets one JSON line per finished ConSpeciFix job, with its
+outcome, run time and copied results file. A run that is started again with the same arguments resumes the plan
+and only runs the jobs without result, and the final results JSON is derived from the journal.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from csf_journal import ResultsJournal
+    journal = ResultsJournal("CSF_clades_journal.jsonl", arguments=sys.argv[1:])
+    if journal.jobs is None:
+        journal.start(jobs, info={...})
+    run_jobs(journal.pending(journal.jobs), out_dir, on_result=journal.add)
+    results = journal.outcomes(journal.jobs)  # True / False / None per job, as run_jobs returns
+
+Output:
+    - JSONL journal file. First line: {"plan": [jobs], "arguments": [...], "info": {...}}. Then one line per job:
+      {"job": prefix, "name", "genome", "source_folder", "species": true/false/null, "seconds", "results", "time"}
+      and "inferred" with the reason for the negatives inferred without running ConSpeciFix (ANI pruning)
+
+Dependencies:
+    - csf_scheduler (this repository)
+    - datetime
+    - json
+    - os
+
+Notes:
+    - Not meant to be run directly, it is imported by the CSF analysis scripts
+    - Jobs are identified by their output prefix, which is unique within a run
+    - Jobs that failed (species null) are recorded too, and run again on resume
+    - Lines are flushed and synced as soon as a job finishes. A partial last line left by a crash is cut off when
+      the journal is opened again, so the next line is appended after the last complete one
+"""
+
+## LIBRARIES
+import json
+import os
+from datetime import datetime
+
+from csf_scheduler import CSFJob
+
+
+JOB_FIELDS = ("name", "test_genome", "source_folder", "work_dir", "out_prefix", "keep_failed", "labels")
+
+
+## FUNCTIONS
+def job_record(job):
+    return {field: getattr(job, field) for field in JOB_FIELDS}
+
+
+def job_from_record(record):
+    return CSFJob(**{field: record[field] for field in JOB_FIELDS})
+
+
+class ResultsJournal:
+    """Plan and finished jobs of a CSF run, stored as an append-only JSONL file"""
+
+    def __init__(self, path, arguments):
+        self.path = path
+        self.arguments = list(arguments)
+        self.jobs = None    # Planned jobs (None: new run)
+        self.info = {}
+        self.records = {}   # Job prefix -> last journal line of the job
+
+        if not os.path.exists(path):
+            return
+
+        with open(path, 'rb+') as file:
+            data = file.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):  # Partial last line from an interrupted write: removed before appending again
+                file.truncate(end)
+
+        for line in data[:end].decode().splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:  # Damaged line
+                continue
+            if "plan" in record:
+                if record["arguments"] != self.arguments:
+                    raise ValueError(
+                        f'{path} belongs to a run with other arguments ({" ".join(record["arguments"])}). '
+                        f'Remove it to start a new run'
+                    )
+                self.jobs = [job_from_record(job) for job in record["plan"]]
+                self.info = record.get("info", {})
+            else:
+                self.records[record["job"]] = record
+
+    def write(self, record):
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def start(self, jobs, info=None):
+        """Records the plan of a new run"""
+        self.jobs = list(jobs)
+        self.info = info or {}
+        self.write({"plan": [job_record(job) for job in self.jobs], "arguments": self.arguments, "info": self.info})
+
+    def add(self, job, species, reason=None):
+        """Records a finished job (run_jobs on_result callback), or an outcome inferred for the given reason"""
+        record = {
+            "job": job.out_prefix,
+            "name": job.name,
+            "genome": job.genome,
+            "source_folder": job.source_folder,
+            "species": species,
+            "seconds": job.seconds,
+            "results": job.results_path,
+            "time": datetime.now().isoformat(timespec='seconds'),
+        }
+        if reason is not None:
+            record["inferred"] = reason
+        self.write(record)
+        self.records[job.out_prefix] = record
+
+    def pending(self, jobs):
+        """Jobs without result in the journal (not run yet, or failed)"""
+        return [job for job in jobs if self.records.get(job.out_prefix, {}).get("species") is None]
+
+    def outcomes(self, jobs):
+        """Species result of every job (None if it has no result), in job order"""
+        return [self.records.get(job.out_prefix, {}).get("species") for job in jobs]
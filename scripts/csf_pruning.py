@@ -0,0 +1,95 @@
+"""
+csf_pruning.py
+----------------------
+ANI-guided pruning of the ConSpeciFix jobs of the CSF analysis scripts. For every (test genome, source group) job,
+the ANI between the test genome and the genomes of the source group is read from the fastANI matrix, and jobs whose
+best ANI is below a floor are not run: there is no gene flow at that distance, so ConSpeciFix would always answer
+"NOT a member". They are recorded as inferred negatives with the ANI values as reason.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from csf_pruning import prune_jobs
+    matrix = load_matrix("fastANI_results.txt")
+    jobs, pruned = prune_jobs(jobs, matrix, ani_floor=80)  # pruned: [(job, reason), ...]
+
+Dependencies:
+    - genome_store (this repository)
+    - numpy
+    - os
+
+Notes:
+    - Not meant to be run directly, it is imported by the CSF analysis scripts
+    - Genomes are matched to the matrix by their genome name (basename without FASTA extension, and without the
+      anotated_ prefix of the clade folders)
+    - fastANI does not report pairs below ~80% ANI, so source genomes without result count as 0 for the max and are
+      left out of the mean
+    - Jobs whose test genome or source genomes are not in the matrix are never pruned, nor are jobs whose test genome
+      is the only source genome in the matrix
+"""
+
+## LIBRARIES
+import os
+
+import numpy as np
+
+from genome_store import genome_name
+
+
+## FUNCTIONS
+def matrix_code(matrix, filename):
+    """Matrix code of a genome file, or None if the genome is not in the matrix"""
+    name = genome_name(filename)
+    for candidate in (name, name.replace('anotated_', '', 1)):
+        if candidate in matrix.index:
+            return matrix.index[candidate]
+
+    return None
+
+
+def source_codes(matrix, folder):
+    """Matrix codes of the genomes of a source group that are in the matrix"""
+    codes = [matrix_code(matrix, f) for f in sorted(os.listdir(folder)) if os.path.isfile(os.path.join(folder, f))]
+    return np.array([code for code in codes if code is not None], dtype=np.int64)
+
+
+def prune_jobs(jobs, matrix, ani_floor):
+    """
+    Splits the jobs into the ones to run and the pruned ones, [(job, reason)], whose max ANI between the test genome
+    and the source genomes is below ani_floor. Job order is kept in both lists
+    """
+    kept, pruned = [], []
+    rows = {}     # Test genome -> ANI against every genome (one value per pair, see AniMatrix.pair_rows)
+    members = {}  # Source folder -> matrix codes of its genomes
+
+    for job in jobs:
+        code = matrix_code(matrix, job.test_genome)
+        if job.source_folder not in members:
+            members[job.source_folder] = source_codes(matrix, job.source_folder)
+        codes = members[job.source_folder]
+        if code is None or not len(codes):
+            kept.append(job)
+            continue
+
+        if code not in rows:
+            rows[code] = matrix.pair_rows([code])[0]
+        values = rows[code][codes[codes != code]]
+        if not len(values):  # The test genome is the only source genome in the matrix
+            kept.append(job)
+            continue
+
+        best = float(values.max())
+        if best >= ani_floor:
+            kept.append(job)
+            continue
+
+        reported = values[values > 0]
+        if len(reported):
+            reason = f'max ANI {best:.2f} (mean {reported.mean():.2f}) below {ani_floor}'
+        else:
+            reason = 'no fastANI result (ANI below ~80)'
+        pruned.append((job, f'{reason} against {len(codes)} source genomes'))
+
+    return kept, pruned
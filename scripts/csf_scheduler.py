@@ -0,0 +1,398 @@
+"""
+csf_scheduler.py
+----------------------
+ConSpeciFix job scheduler used by CSF_clades_analysis.py and CSF_sources_analysis.py.
+The scripts first enumerate every (test genome, source group) comparison as a job, and the jobs are then run on a
+process pool with a fixed number of threads per job and as many concurrent jobs as the CPU and memory budget
+allows. Every job works in its own folder, and results are collected as jobs finish and returned in job order,
+so the scripts build the same results dictionary as the serial loops did.
+In persistent mode every pool process keeps a long-lived ConSpeciFix driver (csf_worker.py) running inside the CSF
+environment and sends it the jobs through a pipe, instead of starting `conda run` for every job.
+With a workspace (csf_workspace.py), job folders are built with links to read-only input copies in a scratch folder,
+and jobs are only started while their folders fit in the disk budget.
+With an outcome cache (csf_cache.py), comparisons already run (same test genome contents, source set and ConSpeciFix
+version) are answered from the cache without running ConSpeciFix.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from csf_scheduler import CSFJob, run_jobs
+    jobs = [CSFJob("1-2", "source_1/genome.fa", "source_2", "CSF_1_2", "1-2"), ...]
+    results = run_jobs(jobs, "CSF_results_and_plots", workers=4)  # True / False / None (failed) per job
+    results = run_jobs(jobs, "CSF_results_and_plots", workers=4, persistent=True)
+    results = run_jobs(jobs, "CSF_results_and_plots", workers=4, workspace=WorkspaceManager("/scratch/CSF"))
+    results = run_jobs(jobs, "CSF_results_and_plots", workers=4, outcome_cache=OutcomeCache("CSF_outcomes.sqlite", v))
+
+Output:
+    - {out_dir}/{prefix}_results.txt and {out_dir}/{prefix}_gno2.png of every finished job
+    - {out_dir}/{prefix}_conspecifix.log with the ConSpeciFix output of every job
+
+Dependencies:
+    - conda
+    - conda environment "CSF" with python 2.7.
+    - ConSpeciFix
+    - csf_cache (this repository)
+    - csf_worker (this repository, run inside the CSF environment)
+    - csf_workspace (this repository)
+    - genome_store (this repository)
+    - concurrent.futures
+    - json
+    - multiprocessing
+    - os
+    - shutil
+    - subprocess
+
+Notes:
+    - Not meant to be run directly, it is imported by the CSF analysis scripts
+    - The thread budget of a job is passed to ConSpeciFix and its tools through the usual thread environment
+      variables (OMP_NUM_THREADS...). The memory budget only limits how many jobs run at once
+    - The CSF environment is resolved once with `conda run` (Python executable and activated environment
+      variables), and the persistent drivers are started directly with them
+    - Without workspace, every job folder gets a copy of its source group and test genome, as before
+"""
+
+## LIBRARIES
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from csf_workspace import new_bytes
+from genome_store import link_file
+
+
+CONSPECIFIX_RUNNER = "/home/estudiante2/JMF/ConSpeciFix/ConSpeciFix-1.3.0/database/runner_personal.py"
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+GNO2_PATH = "_conspecifix/database/User_spec/gno2.png"
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'csf_worker.py')
+
+_worker = None  # Persistent ConSpeciFix driver of the current pool process
+
+
+## FUNCTIONS
+class CSFJob:
+    """One ConSpeciFix comparison: a test genome against the genomes of a source group"""
+
+    def __init__(self, name, test_genome, source_folder, work_dir, out_prefix, keep_failed=False, inputs=None,
+                 link_mode='copy', labels=None):
+        self.name = name                    # Label printed in the progress messages
+        self.test_genome = test_genome      # Path of the test genome FASTA
+        self.source_folder = source_folder
+        self.work_dir = work_dir            # Isolated ConSpeciFix folder of the job
+        self.out_prefix = out_prefix        # Prefix of the results and plot files kept in the output folder
+        self.keep_failed = keep_failed      # Keep work_dir if ConSpeciFix gives no results (for inspection)
+        self.inputs = inputs                # Staged input files linked into work_dir (set by WorkspaceManager)
+        self.link_mode = link_mode
+        self.labels = dict(labels or {})    # Script-specific fields of the job (e.g. clade and source number)
+        self.seconds = None                 # Run time of the finished job (set by run_jobs)
+        self.results_path = None            # Copy of its results.txt in the output folder (set by run_jobs)
+
+    @property
+    def genome(self):
+        """Test genome file name, as listed by ConSpeciFix in results.txt"""
+        return os.path.basename(self.test_genome)
+
+
+def run_conspecific(subfolder_path, log_file, threads=1, runner=CONSPECIFIX_RUNNER):
+    """
+    Executes ConSpeciFix Python 2.7 using conda environment 'CSF'
+    and saves all stdout and stderr to a log file. Returns True if it finished without errors
+    """
+    command = ["conda", "run", "-n", "CSF", "python", runner, subfolder_path]
+    env = dict(os.environ, **{variable: str(threads) for variable in THREAD_VARIABLES})
+
+    with open(log_file, "w") as f:
+        try:
+            subprocess.run(command, stdout=f, stderr=subprocess.STDOUT, text=True, check=True, env=env)
+        except subprocess.CalledProcessError:
+            return False
+
+    return True
+
+
+def conda_environment(name="CSF"):
+    """Python executable and environment variables of an activated conda environment (resolved once)"""
+    command = [
+        "conda", "run", "-n", name, "python", "-c",
+        "import json, os, sys; print(json.dumps([sys.executable, dict(os.environ)]))"
+    ]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    executable, env = json.loads(output.strip().splitlines()[-1])
+
+    return executable, env
+
+
+class CSFWorker:
+    """Long-lived csf_worker.py process inside the CSF environment, fed with one job at a time through a pipe"""
+
+    def __init__(self, executable, env, runner=CONSPECIFIX_RUNNER, preload=()):
+        self.command = [executable, "-u", WORKER_SCRIPT, runner, ",".join(preload)]
+        self.env = env
+        self.process = None
+        self.start()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=self.env, cwd=os.getcwd()
+        )
+
+    def run(self, path, log_path, threads=1):
+        """
+        Runs ConSpeciFix for a folder and returns the driver answer: {path, status, seconds, results}.
+        A driver that stopped is started again once
+        """
+        request = json.dumps({"path": path, "log": log_path, "threads": threads}) + "\n"
+
+        for attempt in range(2):
+            if self.process.poll() is not None:
+                self.start()
+            try:
+                self.process.stdin.write(request)
+                self.process.stdin.flush()
+                answer = self.process.stdout.readline()
+            except (BrokenPipeError, OSError):
+                answer = ""
+            if answer:
+                return json.loads(answer)
+            self.process.kill()
+            self.process.wait()
+
+        raise RuntimeError(f'ConSpeciFix worker stopped while running {path}')
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+
+def start_worker(executable, env, runner, preload):
+    """Pool process initializer: starts the persistent driver of the process"""
+    global _worker
+    _worker = CSFWorker(executable, env, runner, preload)
+    multiprocessing.util.Finalize(_worker, _worker.close, exitpriority=10)
+
+
+def parse_results(results_dir, genome):
+    """Parses a results.txt file from ConSpeciFix and checks whether test genome belong to same species or not"""
+    # Read results file
+    with open(results_dir, 'r') as file:
+        text = file.readlines()
+
+    # Parse text and store same species
+    species = False
+    same_species = []
+
+    for line in text:
+        line = line.rstrip('\n')
+
+        if line == 'The following strains are members of the species:':
+            species = True
+            continue
+
+        if line == 'The following strains were determined to NOT be a member of the species:':
+            species = False
+            continue
+
+        if species and line:
+            same_species.append(line)
+
+    # Check if same species
+    return genome in same_species
+
+
+def extract_and_copy_gno2(new_dir, out_dir, new_name):
+    "Searches for gno2 plot and stores it in directory results_plots with a new name. Returns an error or None"
+
+    gno2_path = os.path.join(new_dir, GNO2_PATH)
+
+    dst_path = os.path.join(out_dir, f"{new_name}")
+
+    try:
+        shutil.copy(gno2_path, dst_path)
+    except Exception as e:
+        return f'Error copying gon2.png plot: {e}'
+
+    return None
+
+
+def prepare_work_dir(job):
+    """Creates the job folder with the source genomes and the test genome (links to the staged inputs if set)"""
+    os.makedirs(job.work_dir, exist_ok=True)
+
+    if job.inputs is not None:
+        for src_f in job.inputs:
+            link_file(src_f, os.path.join(job.work_dir, os.path.basename(src_f)), job.link_mode)
+    else:
+        for f in os.listdir(job.source_folder):
+            src_f = os.path.join(job.source_folder, f)
+            if os.path.isfile(src_f):
+                shutil.copy(src_f, os.path.join(job.work_dir, f))
+
+        shutil.copy(job.test_genome, os.path.join(job.work_dir, job.genome))
+
+
+def run_conspecifix_job(job, out_dir, threads, runner, messages):
+    """Runs ConSpeciFix on the job folder (persistent driver or conda run). Returns True if it finished"""
+    log_path = os.path.join(out_dir, f'{job.out_prefix}_conspecifix.log')
+    if _worker is not None:  # Persistent driver
+        answer = _worker.run(os.path.abspath(job.work_dir), os.path.abspath(log_path), threads)
+        finished = answer["status"] == 0
+        messages.append(f'ConSpeciFix finished with status {answer["status"]} in {answer["seconds"]:.0f} s')
+    else:
+        finished = run_conspecific(os.path.abspath(job.work_dir), log_path, threads, runner)
+    if not finished:
+        messages.append(f'ERROR running ConSpeciFix. Check {log_path} for details.')
+
+    return finished
+
+
+def run_job(job, out_dir, threads=1, runner=CONSPECIFIX_RUNNER):
+    """
+    Runs one ConSpeciFix job in its own folder (worker process). Returns (species, messages, size): species is True
+    or False, or None if ConSpeciFix gave no results, and size is the disk space the job folder used
+    """
+    messages = []
+    prepare_work_dir(job)
+    run_conspecifix_job(job, out_dir, threads, runner, messages)
+
+    size = new_bytes(job.work_dir)
+    results_path = os.path.join(job.work_dir, "results.txt")
+    if not os.path.isfile(results_path):
+        messages.append("Error: no file results.txt retrieved for the analysis")
+        if job.keep_failed:
+            messages.append(f'Job folder kept in {job.work_dir}')
+        else:
+            shutil.rmtree(job.work_dir)
+        return None, messages, size
+
+    # Keep results.txt and gno2.png plot in the output folder
+    shutil.copy(results_path, os.path.join(out_dir, f'{job.out_prefix}_results.txt'))
+    error = extract_and_copy_gno2(job.work_dir, out_dir, f'{job.out_prefix}_gno2.png')
+    if error:
+        messages.append(error)
+
+    species = parse_results(results_path, job.genome)
+    shutil.rmtree(job.work_dir)
+
+    return species, messages, size
+
+
+def job_slots(workers, threads_per_job=1, memory_per_job_gb=None, total_memory_gb=None):
+    """Number of jobs that can run at once within the CPU and memory budget"""
+    slots = min(workers, max(1, (os.cpu_count() or 1) // threads_per_job))
+    if memory_per_job_gb and total_memory_gb:
+        slots = min(slots, max(1, int(total_memory_gb // memory_per_job_gb)))
+
+    return slots
+
+
+def run_pool(pool, tasks, slots, workspace=None):
+    """
+    Submits (key, function, (job, ...)) tasks to the pool while there are free slots and the disk budget allows it,
+    and yields (key, result, seconds) as they finish. Failed tasks give (None, [error], 0)
+    """
+    queue = list(tasks)
+    futures = {}
+    while queue or futures:
+        while queue and len(futures) < slots:
+            if workspace is not None and not workspace.fits([job for _, job, _ in futures.values()]):
+                if futures:
+                    break
+                print('Warning: disk budget exceeded, running a single job')
+            key, function, args = queue.pop(0)
+            futures[pool.submit(function, *args)] = key, args[0], time.monotonic()
+
+        finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in finished:
+            key, job, start = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:  # Copy errors, missing folders...
+                result = None, [f'Error in job {job.name}: {e}'], 0
+            yield key, result, time.monotonic() - start
+
+
+def record(workspace, job, result, size):
+    """Updates the disk budget of the workspace with a finished job"""
+    if workspace is None:
+        return
+    workspace.record(size)
+    if result is None and job.keep_failed:
+        workspace.keep(job)
+
+
+def run_jobs(jobs, out_dir, workers=4, threads_per_job=1, memory_per_job_gb=None, total_memory_gb=None,
+             runner=CONSPECIFIX_RUNNER, on_result=None, persistent=False, preload=(), workspace=None,
+             outcome_cache=None):
+    """
+    Runs the jobs on a process pool and returns their species results (see run_job) in job order.
+    on_result(job, species) is called in the main process as every job finishes (job.seconds: run time,
+    job.results_path: copied results file or None). With persistent=True, each pool
+    process sends its jobs to its own csf_worker.py driver (preload: modules the drivers import once).
+    With a WorkspaceManager, job folders are linked from its staged inputs and a job is only submitted when its
+    folder fits in the disk budget (always at least one job running).
+    With an OutcomeCache, jobs already run are restored from it and the outcomes of the new jobs are stored in it
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    slots = job_slots(workers, threads_per_job, memory_per_job_gb, total_memory_gb)
+    print(f'Running {len(jobs)} ConSpeciFix jobs, {slots} at a time ({threads_per_job} threads each)\n')
+
+    # Forked workers: the CSF scripts run at import time, so they must not be imported again by spawned workers
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+
+    results = [None] * len(jobs)
+    done = 0
+    queued = list(range(len(jobs)))
+    if outcome_cache is not None:  # Comparisons already run
+        queued = []
+        for i, job in enumerate(jobs):
+            species = outcome_cache.restore(job, out_dir)
+            if species is None:
+                queued.append(i)
+                continue
+            done += 1
+            results[i] = species
+            job.seconds, job.results_path = 0.0, os.path.join(out_dir, f'{job.out_prefix}_results.txt')
+            print(f'[{done}/{len(jobs)}] {job.name}\n\tOutcome restored from the cache')
+            if on_result is not None:
+                on_result(job, species)
+
+    pending = [jobs[i] for i in queued]
+    if workspace is not None:
+        workspace.prepare(pending)
+
+    initializer, initargs = None, ()
+    if persistent and pending:
+        executable, env = conda_environment()
+        initializer, initargs = start_worker, (executable, env, runner, tuple(preload))
+
+    with ProcessPoolExecutor(max_workers=slots, mp_context=context, initializer=initializer, initargs=initargs) as pool:
+        tasks = [(i, run_job, (jobs[i], out_dir, threads_per_job, runner)) for i in queued]
+        for i, result, seconds in run_pool(pool, tasks, slots, workspace):
+            job = jobs[i]
+            species, messages, size = result
+            record(workspace, job, species, size)
+            if outcome_cache is not None and species is not None:
+                outcome_cache.store(job, species, out_dir)
+            job.seconds = round(seconds, 1)
+            results_path = os.path.join(out_dir, f'{job.out_prefix}_results.txt')
+            job.results_path = results_path if species is not None else None
+
+            done += 1
+            results[i] = species
+            print(f'[{done}/{len(jobs)}] {job.name}')
+            for message in messages:
+                print(f'\t{message}')
+            if on_result is not None:
+                on_result(job, species)
+
+    if workspace is not None:
+        workspace.close()
+
+    return results
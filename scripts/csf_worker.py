@@ -0,0 +1,129 @@
+"""
+csf_worker.py
+----------------------
+Long-lived ConSpeciFix driver, started once inside the CSF conda environment (Python 2.7) by csf_scheduler.py.
+It reads one job per line from stdin, runs ConSpeciFix runner_personal.py for it in a forked child process (so the
+interpreter and the preloaded modules are not started again for every job) and answers on stdout with the exit
+status, run time and results path of the job.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    python csf_worker.py runner_personal.py [module1,module2,...]
+
+    Request line (JSON):  {"path": "/abs/CSF_1_2", "log": "/abs/CSF_1_2.log", "threads": 1}
+    Answer line (JSON):   {"path": "/abs/CSF_1_2", "status": 0, "seconds": 812.4, "results": "/abs/CSF_1_2/results.txt"}
+
+Dependencies:
+    - ConSpeciFix
+    - json
+    - os
+    - runpy
+    - sys
+    - time
+    - traceback
+
+Notes:
+    - Not meant to be run by hand, csf_scheduler.py starts and stops the workers
+    - Must stay compatible with Python 2.7 (the CSF environment), so no f-strings are used
+    - Optional comma-separated modules are imported once before the first job and shared by all the forked jobs
+    - "results" is null if the job did not write a results.txt file
+"""
+
+## LIBRARIES
+import json
+import os
+import runpy
+import sys
+import time
+import traceback
+
+
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+## FUNCTIONS
+def preload(modules):
+    """Imports the given modules before forking, ignoring the ones that are not available"""
+    for module in modules:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+
+def run_child(runner, path, log_path, threads):
+    """Runs ConSpeciFix for one folder in the current (forked) process, with stdout/stderr sent to the log file"""
+    log = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(log, 1)
+    os.dup2(log, 2)
+    os.close(log)
+    sys.stdin.close()
+
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads)
+
+    sys.argv = [runner, path]
+    sys.path[0] = os.path.dirname(os.path.abspath(runner))
+
+    code = 0
+    try:
+        runpy.run_path(runner, run_name='__main__')
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
+
+
+def run_job(runner, request):
+    """Forks a child for a job request and waits for it. Returns the answer dictionary"""
+    start = time.time()
+    path = request["path"]
+
+    pid = os.fork()
+    if pid == 0:
+        run_child(runner, path, request["log"], request.get("threads", 1))
+
+    status = os.waitpid(pid, 0)[1]
+    if os.WIFEXITED(status):
+        code = os.WEXITSTATUS(status)
+    else:
+        code = -os.WTERMSIG(status)
+
+    results = os.path.join(path, "results.txt")
+    return {
+        "path": path,
+        "status": code,
+        "seconds": round(time.time() - start, 3),
+        "results": results if os.path.isfile(results) else None,
+    }
+
+
+## MAIN PROGRAM
+if __name__ == '__main__':
+
+    if len(sys.argv) not in (2, 3):
+        sys.stderr.write('Use: csf_worker.py runner_personal.py [module1,module2,...]\n')
+        sys.exit(1)
+
+    runner = sys.argv[1]
+    if len(sys.argv) == 3:
+        preload([module for module in sys.argv[2].split(',') if module])
+
+    while True:
+        line = sys.stdin.readline()
+        if not line:  # Scheduler closed the pipe
+            break
+        if not line.strip():
+            continue
+
+        answer = run_job(runner, json.loads(line))
+        sys.stdout.write(json.dumps(answer) + '\n')
+        sys.stdout.flush()
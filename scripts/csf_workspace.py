@@ -0,0 +1,151 @@
+"""
+csf_workspace.py
+----------------------
+Workspace manager for the ConSpeciFix jobs run by csf_scheduler.py. Every input genome (source group genomes and
+test genomes) is copied once into a scratch folder and made read-only, and each job folder is then built from
+these copies with hardlinks or symlinks instead of copying the whole source group again for every job.
+The scratch folder can be placed on a fast local disk or tmpfs, and job folders are admitted under a disk budget.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from csf_workspace import WorkspaceManager
+    workspace = WorkspaceManager("/scratch/CSF_workspaces", link_mode="hardlink", disk_budget_gb=50)
+    results = run_jobs(jobs, "CSF_results_and_plots", workspace=workspace)
+
+Output:
+    - {scratch_root}/inputs/ read-only copies of the input genomes (removed by close)
+    - {scratch_root}/jobs/ job folders (removed when each job finishes, failed ones may be kept)
+
+Dependencies:
+    - hashlib
+    - os
+    - shutil
+    - stat
+
+Notes:
+    - Not meant to be run directly, it is imported by csf_scheduler.py
+    - Inputs are read-only so that a job can never modify the copy shared by the other jobs through hardlinks
+    - The disk budget covers the input copies, the running job folders (estimated from the largest finished job)
+      and the failed job folders kept for inspection, which are removed oldest first when space is needed.
+      min_free_gb is always left free on the scratch filesystem
+"""
+
+## LIBRARIES
+import hashlib
+import os
+import shutil
+import stat
+
+
+GB = 1 << 30
+
+
+## FUNCTIONS
+def new_bytes(folder):
+    """Disk space used by the files of a folder that are not shared with other folders (hardlinks, symlinks)"""
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            info = os.lstat(os.path.join(root, name))
+            if stat.S_ISREG(info.st_mode) and info.st_nlink == 1:
+                total += info.st_blocks * 512
+
+    return total
+
+
+class WorkspaceManager:
+    """Read-only input copies, linked job folders and disk budget of the ConSpeciFix jobs"""
+
+    def __init__(self, scratch_root="CSF_workspaces", link_mode="hardlink", disk_budget_gb=None, min_free_gb=1,
+                 job_size_gb=0.5):
+        self.scratch_root = os.path.abspath(scratch_root)
+        self.inputs_dir = os.path.join(self.scratch_root, 'inputs')
+        self.jobs_dir = os.path.join(self.scratch_root, 'jobs')
+        self.link_mode = link_mode
+        self.budget = disk_budget_gb * GB if disk_budget_gb else None
+        self.min_free = min_free_gb * GB
+        self.job_size = job_size_gb * GB    # Estimated space of a job folder, raised with the finished jobs
+        self.staged = {}                    # Input path -> read-only copy
+        self.staged_bytes = 0
+        self.kept = []                      # Failed job folders kept for inspection, oldest first
+        os.makedirs(self.inputs_dir, exist_ok=True)
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def stage(self, path):
+        """Read-only copy of an input file in the scratch folder (made only once per file)"""
+        path = os.path.abspath(path)
+        if path not in self.staged:
+            folder = os.path.join(self.inputs_dir, hashlib.sha1(path.encode()).hexdigest()[:16])
+            os.makedirs(folder, exist_ok=True)
+            copy = os.path.join(folder, os.path.basename(path))
+            if not os.path.exists(copy):
+                shutil.copyfile(path, copy)
+                os.chmod(copy, 0o444)
+            self.staged[path] = copy
+            self.staged_bytes += os.path.getsize(copy)
+
+        return self.staged[path]
+
+    def prepare(self, jobs):
+        """Stages the inputs of the jobs and points them to linked job folders inside the scratch folder"""
+        sources = {}
+        for job in jobs:
+            if job.source_folder not in sources:
+                sources[job.source_folder] = [
+                    self.stage(os.path.join(job.source_folder, f)) for f in sorted(os.listdir(job.source_folder))
+                    if os.path.isfile(os.path.join(job.source_folder, f))
+                ]
+            job.inputs = sources[job.source_folder] + [self.stage(job.test_genome)]
+            job.link_mode = self.link_mode
+            job.work_dir = os.path.join(self.jobs_dir, os.path.basename(os.path.normpath(job.work_dir)))
+
+    def record(self, size):
+        """Updates the job folder size estimate with the size of a finished job"""
+        self.job_size = max(self.job_size, size)
+
+    def keep(self, job):
+        """Registers the folder of a failed job that was kept for inspection"""
+        if os.path.isdir(job.work_dir):
+            self.kept.append((job.work_dir, new_bytes(job.work_dir)))
+
+    def used(self, running):
+        """Space accounted to the scratch folder with `running` jobs in progress"""
+        return self.staged_bytes + sum(size for _, size in self.kept) + running * self.job_size
+
+    def pending_bytes(self, running):
+        """Space the running jobs can still write: estimated job size minus what each job folder already holds"""
+        pending = 0
+        for job in running:
+            written = new_bytes(job.work_dir) if os.path.isdir(job.work_dir) else 0
+            pending += max(self.job_size - written, 0)
+
+        return pending
+
+    def fits(self, running):
+        """
+        True if one more job can start while the given jobs are running. The free disk space must hold the rest of
+        the running jobs and the new one. Kept failed job folders are removed (oldest first) to make room
+        """
+        while True:
+            within_budget = self.budget is None or self.used(len(running) + 1) <= self.budget
+            free = shutil.disk_usage(self.scratch_root).free
+            if within_budget and free - self.pending_bytes(running) - self.job_size >= self.min_free:
+                return True
+            if not self.kept:
+                return False
+
+            folder, _ = self.kept.pop(0)
+            print(f'Disk budget: removing kept job folder {folder}')
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def close(self):
+        """Removes the input copies (kept failed job folders stay in the jobs folder)"""
+        for root, dirs, _ in os.walk(self.inputs_dir):
+            for name in dirs:
+                os.chmod(os.path.join(root, name), 0o755)
+        shutil.rmtree(self.inputs_dir, ignore_errors=True)
+        self.staged = {}
+        self.staged_bytes = 0
@@ -0,0 +1,290 @@
+"""
+fastani_orchestrator.py
+----------------------
+Runs the all-vs-all fastANI step in shards and incrementally. Query genomes are split into shards that are run as
+parallel fastANI jobs, each one with a fixed thread budget, and the shard outputs are merged into a single
+fastANI results table. A ledger records which genome pairs already have results, so that adding new genomes only
+computes the new x all and all x new comparisons, which are appended to the existing table.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    python fastani_orchestrator.py genomes_path fastANI_results [--incremental | --force]
+
+Output:
+    - fastANI_results table (created, or extended in incremental mode)
+    - {fastANI_results}.ledger JSON lines file, one line per merged shard with its query and reference genomes and
+      the byte range of its rows in the table (offset, end)
+    - fastANI_shards/ folder with the genome lists and logs of each shard
+
+Dependencies:
+    - ani_loader (this repository)
+    - genome_store (this repository)
+    - concurrent.futures
+    - json
+    - os
+    - subprocess
+    - sys
+    - threading
+
+Notes:
+    - genomes_path can be SAR11_genomes.zip or a folder with FASTA files
+    - An existing table is only extended with --incremental. --force computes the table and its ledger again from
+      scratch, and without either flag the script refuses to run
+    - The ledger line of a shard is written before its rows are appended to the table. On restart, rows after the
+      end of the last shard in the ledger are cut off, and a shard whose rows are incomplete is removed from the
+      ledger and the table, so it is run again without duplicating rows
+    - If an existing table has no ledger, every genome found as query in the table is considered already compared
+      against all the others (as after a full all-vs-all run)
+    - fastANI does not report pairs below ~80% ANI, so the ledger (not the table) tells which pairs were computed
+    - fastANI binary, shard size and thread budgets can be changed directly in the code
+"""
+
+# To be changed by user
+fastani_bin = "fastANI"
+shard_size = 50                     # Query genomes per fastANI job
+threads_per_job = 4                 # fastANI -t value of each job
+total_threads = None                # Threads shared by all jobs (None = all available CPUs)
+
+
+## LIBRARIES
+import json
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ani_loader import load_fastani
+from genome_store import open_store
+
+
+## FUNCTIONS
+class PairLedger:
+    """Append-only record of the (query genomes x reference genomes) blocks already computed"""
+
+    def __init__(self, path):
+        self.path = path
+        self.blocks = []    # (queries, references, offset, end): byte range of the block rows in the table
+        self.lock = threading.Lock()
+
+        if not os.path.exists(path):
+            return
+
+        with open(path, 'rb+') as file:
+            data = file.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):  # Partial last line from an interrupted write: removed before appending again
+                file.truncate(end)
+
+        for line in data[:end].decode().splitlines():
+            try:
+                block = json.loads(line)
+            except ValueError:  # Damaged line
+                continue
+            self.blocks.append(
+                (set(block["queries"]), set(block["references"]), block.get("offset"), block.get("end"))
+            )
+
+    def add(self, queries, references, offset=None, end=None):
+        """Records a block of pairs whose rows take the [offset, end) byte range of the table"""
+        with self.lock:
+            with open(self.path, 'a') as file:
+                record = {"queries": sorted(queries), "references": sorted(references), "offset": offset, "end": end}
+                file.write(json.dumps(record) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            self.blocks.append((set(queries), set(references), offset, end))
+
+    def rewrite(self):
+        """Writes the ledger again with the current blocks (replaced atomically)"""
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as file:
+            for queries, references, offset, end in self.blocks:
+                record = {"queries": sorted(queries), "references": sorted(references), "offset": offset, "end": end}
+                file.write(json.dumps(record) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def recover(self, table_path):
+        """
+        Makes the table match the ledger after an interrupted merge: a last block whose rows were not fully
+        appended is removed from the ledger and its rows from the table, and rows after the end of the last block
+        are cut off. Ledgers written before byte ranges were recorded are left as they are
+        """
+        if not self.blocks or self.blocks[-1][3] is None:
+            return
+
+        size = os.path.getsize(table_path)
+        _, _, offset, end = self.blocks[-1]
+        if size < end:
+            self.blocks.pop()
+            self.rewrite()
+            end = offset
+            print('Last shard of the ledger was not fully merged: its rows are removed and it will be run again')
+        elif size > end:
+            print(f'{size - end} bytes of rows without ledger entry removed from {table_path}')
+        if size > end:
+            with open(table_path, 'rb+') as table:
+                table.truncate(end)
+
+    def missing_references(self, genomes):
+        """{query: set of references} with the pairs among the given genomes that have not been computed yet"""
+        genomes = set(genomes)
+        covered = {genome: set() for genome in genomes}
+        for queries, references, _, _ in self.blocks:
+            for query in queries & genomes:
+                covered[query] |= references
+
+        return {genome: genomes - covered[genome] for genome in genomes if genomes - covered[genome]}
+
+
+def bootstrap_ledger(ledger, table_path):
+    """Records an existing all-vs-all table without ledger as a single computed block"""
+    table = load_fastani(table_path)
+    genomes = set(table.names[table.query].tolist())
+    if genomes:
+        ledger.add(genomes, genomes, 0, os.path.getsize(table_path))
+        print(f'Ledger created from {table_path}: {len(genomes)} genomes already compared')
+
+
+def write_list(path, genome_paths):
+    with open(path, 'w') as file:
+        for genome_path in genome_paths:
+            file.write(f'{os.path.abspath(genome_path)}\n')
+
+
+def run_shard(shard_dir, num, queries, references, paths):
+    """Runs fastANI for a shard of query genomes against a list of references. Returns the shard output path"""
+    query_list = os.path.join(shard_dir, f'shard_{num}_queries.txt')
+    reference_list = os.path.join(shard_dir, f'shard_{num}_references.txt')
+    out_path = os.path.join(shard_dir, f'shard_{num}_fastANI.txt')
+    log_path = os.path.join(shard_dir, f'shard_{num}.log')
+
+    write_list(query_list, [paths[g] for g in queries])
+    write_list(reference_list, [paths[g] for g in references])
+
+    command = [
+        fastani_bin, "--ql", query_list, "--rl", reference_list,
+        "-t", str(threads_per_job), "-o", out_path
+    ]
+    with open(log_path, 'w') as log:
+        subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, check=True)
+
+    return out_path
+
+
+def plan_shards(missing):
+    """
+    Splits the missing pairs ({query: set of references}) into shards of up to shard_size query genomes.
+    Queries missing the same references share shards (e.g. all x all, new x all, old x new)
+    """
+    by_references = {}
+    for query, references in missing.items():
+        by_references.setdefault(frozenset(references), []).append(query)
+
+    shards = []
+    for references, queries in sorted(by_references.items(), key=lambda item: sorted(item[1])):
+        queries = sorted(queries)
+        for i in range(0, len(queries), shard_size):
+            shards.append((queries[i:i + shard_size], sorted(references)))
+
+    return shards
+
+
+def run_shards(shards, paths, table_path, ledger, shard_dir='fastANI_shards'):
+    """Runs the shards in parallel and appends each finished shard output to the results table"""
+    os.makedirs(shard_dir, exist_ok=True)
+    n_jobs = max(1, (total_threads or os.cpu_count() or 1) // threads_per_job)
+    table_lock = threading.Lock()
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        futures = {
+            pool.submit(run_shard, shard_dir, num, queries, references, paths): (num, queries, references)
+            for num, (queries, references) in enumerate(shards, start=1)
+        }
+
+        for future in as_completed(futures):
+            num, queries, references = futures[future]
+            try:
+                out_path = future.result()
+            except (subprocess.CalledProcessError, OSError) as e:
+                print(f'Error in shard {num}: {e}. Check {shard_dir}/shard_{num}.log')
+                failed += 1
+                continue
+
+            # Merge: record the shard and the byte range of its rows in the ledger, then append the rows
+            with table_lock, open(table_path, 'ab') as table, open(out_path, 'rb') as shard:
+                offset = table.seek(0, os.SEEK_END)
+                ledger.add(queries, references, offset, offset + os.path.getsize(out_path))
+                for chunk in iter(lambda: shard.read(1 << 20), b''):
+                    table.write(chunk)
+            print(f'Shard {num}/{len(shards)} finished ({len(queries)} x {len(references)} genomes)')
+
+    return failed
+
+
+## MAIN PROGRAM
+if __name__ == '__main__':
+
+    # Check arguments
+    args = [a for a in sys.argv[1:] if a not in ('--incremental', '--force')]
+    incremental = '--incremental' in sys.argv[1:]
+    force = '--force' in sys.argv[1:]
+
+    if len(args) != 2 or (incremental and force):
+        print('Use: fastani_orchestrator.py genomes_path fastANI_results [--incremental | --force]')
+        sys.exit(1)
+
+    genomes_path, table_path = args
+    if not os.path.exists(genomes_path):
+        print(f'Error: {genomes_path} not found!')
+        sys.exit(1)
+
+    if os.path.exists(table_path) and not (incremental or force):
+        print(f'Error: {table_path} already exists. Use --incremental to extend it or --force to compute it again')
+        sys.exit(1)
+
+    # Genome FASTA files (extracted once from the archive if needed, fastANI reads them from disk)
+    store = open_store(genomes_path)
+    paths = {name: store.path(name) for name in store.names()}
+    all_genomes = set(paths)
+
+    ledger_path = f'{table_path}.ledger'
+
+    if incremental and os.path.exists(table_path):
+        ledger = PairLedger(ledger_path)
+        if ledger.blocks:
+            ledger.recover(table_path)
+        else:
+            bootstrap_ledger(ledger, table_path)
+
+        # Only pairs without results: new x all and all x new (plus any shard that failed before)
+        missing = ledger.missing_references(all_genomes)
+        print(f'{len(all_genomes) - len(missing)} genomes already compared, {len(missing)} with missing pairs')
+    else:
+        for path in (table_path, ledger_path):
+            if os.path.exists(path):
+                os.remove(path)
+        ledger = PairLedger(ledger_path)
+        missing = {genome: all_genomes for genome in all_genomes}
+
+    shards = plan_shards(missing)
+
+    if not shards:
+        print('Nothing to compute: all genome pairs already have results')
+        sys.exit(0)
+
+    print(f'Running {len(shards)} fastANI shards ...')
+    failed = run_shards(shards, paths, table_path, ledger)
+    store.close()
+
+    if failed:
+        print(f'\n{failed} shards failed. Run again with --incremental to retry them')
+        sys.exit(1)
+
+    print(f'\nAnalysis completed! fastANI results are available in {table_path}')
@@ -0,0 +1,146 @@
+"""
+genome_cache.py
+----------------------
+Persistent on-disk cache of genome FASTA files, used by genomes_download.py.
+Genomes are stored once under their SHA-256 checksum (content-addressed) and indexed by accession version,
+so already downloaded genomes are served without network access and interrupted runs resume where they stopped.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from genome_cache import GenomeCache
+    cache = GenomeCache('genome_cache')
+    if not cache.has(acc):
+        cache.add(acc, downloaded_fasta)
+    cache.materialise(acc, output_fasta)
+
+Output:
+    - {cache_dir}/objects/{sha[:2]}/{sha}.fa FASTA files
+    - {cache_dir}/index.tsv append-only index with accession, checksum, size and download time
+
+Dependencies:
+    - genome_store (this repository)
+    - hashlib
+    - os
+    - shutil
+    - threading
+    - time
+
+Notes:
+    - Each genome is committed to the cache as soon as it is downloaded. The index is append-only and the last
+      line of an accession wins, so a crash never leaves a half-written entry behind
+    - Cached files are materialised as hardlinks when possible, and copied otherwise
+"""
+
+## LIBRARIES
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from genome_store import link_file
+
+
+CHUNK_SIZE = 1 << 20
+
+
+## FUNCTIONS
+def fasta_checksum(path):
+    """SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class GenomeCache:
+    """Content-addressed genome store indexed by accession version"""
+
+    def __init__(self, cache_dir, max_age_days=None):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.tsv')
+        self.max_age = max_age_days * 86400 if max_age_days is not None else None
+        self.lock = threading.Lock()
+        self.entries = {}  # accession -> (sha256, size, fetched)
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Reads the index. Later lines of an accession replace earlier ones"""
+        if not os.path.exists(self.index_path):
+            return
+
+        with open(self.index_path, 'r') as file:
+            for line in file:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != 4:  # Partial line from an interrupted write
+                    continue
+                acc, sha, size, fetched = fields
+                self.entries[acc] = (sha, int(size), float(fetched))
+
+    def object_path(self, sha):
+        return os.path.join(self.objects_dir, sha[:2], f'{sha}.fa')
+
+    def has(self, acc):
+        """True if the accession is cached and its FASTA is still on disk"""
+        entry = self.entries.get(acc)
+        return entry is not None and os.path.exists(self.object_path(entry[0]))
+
+    def is_stale(self, acc):
+        """True if the accession is missing, or older than max_age_days when an age limit is set"""
+        if not self.has(acc):
+            return True
+        if self.max_age is None:
+            return False
+
+        return time.time() - self.entries[acc][2] > self.max_age
+
+    def verify(self, acc):
+        """True if the cached FASTA of the accession still matches its checksum"""
+        if not self.has(acc):
+            return False
+        sha = self.entries[acc][0]
+
+        return fasta_checksum(self.object_path(sha)) == sha
+
+    def add(self, acc, fasta_path):
+        """Moves a downloaded FASTA into the cache and records it in the index. Returns its checksum"""
+        sha = fasta_checksum(fasta_path)
+        size = os.path.getsize(fasta_path)
+        obj_path = self.object_path(sha)
+
+        os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+        if os.path.exists(obj_path) and fasta_checksum(obj_path) == sha:  # Same content already stored and intact
+            os.remove(fasta_path)
+        elif os.path.exists(obj_path):  # Corrupt stored object (failed verify): replaced by the new download
+            os.replace(fasta_path, obj_path)
+        else:
+            shutil.move(fasta_path, obj_path)
+
+        fetched = time.time()
+        with self.lock:
+            with open(self.index_path, 'a') as file:
+                file.write(f'{acc}\t{sha}\t{size}\t{fetched}\n')
+                file.flush()
+                os.fsync(file.fileno())
+            self.entries[acc] = (sha, size, fetched)
+
+        return sha
+
+    def materialise(self, acc, out_path):
+        """Places the cached FASTA of an accession in out_path"""
+        link_file(self.object_path(self.entries[acc][0]), out_path, 'hardlink')
+
+    def incoming_path(self, acc):
+        """Temporary path where a genome is downloaded before being added to the cache"""
+        incoming_dir = os.path.join(self.cache_dir, 'incoming')
+        os.makedirs(incoming_dir, exist_ok=True)
+
+        return os.path.join(incoming_dir, f'{acc}.fa')
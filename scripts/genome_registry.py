@@ -0,0 +1,120 @@
+"""
+genome_registry.py
+----------------------
+Shared genome metadata registry. Parses the genomes table (Supplementary Table S3 from Free et al. 2024) once,
+normalises its Completeness and Contamination columns and builds hash indexes by isolate ID, accession and subgroup,
+so that scripts look genomes up in O(1) instead of scanning the whole DataFrame for every genome.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from genome_registry import GenomeRegistry, data_filtering
+    registry = GenomeRegistry.from_table("Genomes_table.txt")
+    acc = registry.isolate("HTCC1062")["RefSeq Assembly (*IMG Genome ID)"]
+
+Dependencies:
+    - pandas
+    - collections
+
+Notes:
+    - When an isolate ID or accession appears in several rows, the first one is indexed (as .iloc[0] did)
+    - Completeness and Contamination use commas as decimal separator in the original table. They are
+      converted to numeric values in registry.table (used for filtering), while the rows returned by the lookups keep
+      the values as written in the table
+"""
+
+## LIBRARIES
+from collections import defaultdict
+
+import pandas as pd
+
+
+ISOLATE_COL = "SAG or Isolate ID"
+ACCESSION_COL = "RefSeq Assembly (*IMG Genome ID)"
+SUBGROUP_COL = "Subgroup"
+
+
+## FUNCTIONS
+def normalise_quality(data):
+    """Returns a copy of the table with numeric Completeness and Contamination columns"""
+    data = data.copy()
+
+    for col in ("Completeness", "Contamination"):
+        data[col] = data[col].astype(str).str.replace(',', '.')
+        data[col] = pd.to_numeric(data[col], errors='coerce')
+
+    return data
+
+
+def index_by(data, column):
+    """Builds a {value: [row records]} dictionary of a table, keeping the table order within each value"""
+    index = defaultdict(list)
+    for record in data.to_dict('records'):
+        key = record[column]
+        if pd.notna(key):
+            index[key].append(record)
+
+    return dict(index)
+
+
+def data_filtering(data, comp_th, cont_th):
+    """Filters a dataset (normalised by GenomeRegistry) according to completeness and contamination thresholds"""
+
+    # Apply filters
+    sset = data[(data["Completeness"] >= comp_th) & (data["Contamination"] <= cont_th)]
+
+    print('Total maintained:', len(sset),'\n')
+
+    # Calculate metrics with a single grouped count per table
+    counts = data[SUBGROUP_COL].value_counts()
+    sset_counts = sset[SUBGROUP_COL].value_counts().reindex(counts.index, fill_value=0)
+
+    for g, count in counts.items():
+        sset_count = sset_counts[g]
+
+        fraction = f'{sset_count}/{count}'
+        percentage = round(sset_count / count * 100,2)
+
+        print(f'{fraction} ({percentage}%) samples are maintained for group {g}!')
+
+    return sset
+
+
+class GenomeRegistry:
+    """Genomes table with hash indexes by isolate ID, accession and subgroup"""
+
+    def __init__(self, data):
+        self.table = normalise_quality(data)
+        self.by_isolate = {}
+        self.by_accession = {}
+        self.by_subgroup = defaultdict(list)
+
+        for record in data.to_dict('records'):  # Values as written in the table
+            self.by_isolate.setdefault(record[ISOLATE_COL], record)
+
+            acc = record[ACCESSION_COL]
+            if pd.notna(acc):
+                self.by_accession.setdefault(acc, record)
+
+            group = record[SUBGROUP_COL]
+            if pd.notna(group):
+                self.by_subgroup[group].append(record)
+
+    @classmethod
+    def from_table(cls, path):
+        """Reads a tab-separated genomes table"""
+        return cls(pd.read_csv(path, sep='\t'))
+
+    def isolate(self, isolate_id):
+        """Row of an isolate ID. Raises KeyError if not found"""
+        return self.by_isolate[isolate_id]
+
+    def accession(self, acc):
+        """Row of a RefSeq/GenBank accession. Raises KeyError if not found"""
+        return self.by_accession[acc]
+
+    def subgroup(self, group):
+        """Rows of all the genomes of a subgroup"""
+        return self.by_subgroup.get(group, [])
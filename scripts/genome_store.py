@@ -0,0 +1,288 @@
+"""
+genome_store.py
+----------------------
+Read-only genome store that lists, streams and materialises genome FASTA files straight from SAR11_genomes.zip
+(or from an already extracted SAR11_genomes/ folder), so downstream steps do not need to extract the whole
+archive and then copy every genome again into their group folders.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from genome_store import open_store, stage_genomes
+    store = open_store("SAR11_genomes.zip")
+    for name in store.names():
+        store.materialise(name, "source_genomes_1", mode="hardlink")
+    stage_genomes(store, {genome: output_folder, ...}, mode="hardlink", workers=8)
+
+Dependencies:
+    - concurrent.futures
+    - fcntl
+    - os
+    - shutil
+    - threading
+    - zipfile
+
+Notes:
+    - Link modes: "hardlink", "symlink", "reflink" (copy-on-write clone, Linux only) and "copy".
+      Hardlinks and reflinks fall back to a copy when the filesystem does not support them
+    - Links need a file on disk: when linking from an archive, each genome is extracted once into a backing folder
+      (the archive name without .zip) the first time it is needed, and every group folder links to that file
+    - Uncompressed (stored) archive members are copied with a single kernel-side byte-range copy
+"""
+
+## LIBRARIES
+import os
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, reflinks fall back to copies
+    fcntl = None
+
+
+FASTA_EXTENSIONS = ('.fa', '.fasta', '.fna')
+LINK_MODES = ('hardlink', 'symlink', 'reflink', 'copy')
+FICLONE = 0x40049409  # Linux ioctl request to clone a file (reflink)
+CHUNK_SIZE = 1 << 20
+
+
+## FUNCTIONS
+def genome_name(filename):
+    """Genome name of a FASTA filename (basename without extension)"""
+    base = os.path.basename(filename)
+    for ext in FASTA_EXTENSIONS:
+        if base.endswith(ext):
+            return base[:-len(ext)]
+
+    return base
+
+
+def reflink_file(src, dst):
+    """Clones src into dst sharing its blocks (btrfs, xfs...). Raises OSError if not supported"""
+    if fcntl is None:
+        raise OSError('reflinks are not supported on this platform')
+
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def link_file(src, dst, mode='hardlink'):
+    """Places src in dst according to the link mode, replacing dst if it exists"""
+    if mode not in LINK_MODES:
+        raise ValueError(f'Invalid link mode {mode}. Use one of: {", ".join(LINK_MODES)}')
+
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return
+
+    try:
+        if mode == 'hardlink':
+            os.link(src, dst)
+            return
+        if mode == 'reflink':
+            reflink_file(src, dst)
+            return
+    except OSError:
+        pass  # Cross-device link or unsupported filesystem
+
+    shutil.copyfile(src, dst)
+
+
+def copy_range(src_file, offset, length, dst_file):
+    """Copies length bytes starting at offset from one open file to another, in the kernel when possible"""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while length > 0:
+                copied = os.copy_file_range(src_file.fileno(), dst_file.fileno(), length, offset)
+                if copied == 0:
+                    break
+                offset += copied
+                length -= copied
+            return
+        except OSError:
+            pass  # Fall back to a user-space copy
+
+    src_file.seek(offset)
+    while length > 0:
+        chunk = src_file.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            break
+        dst_file.write(chunk)
+        length -= len(chunk)
+
+
+class DirGenomeStore:
+    """Genome store backed by a folder of FASTA files"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.files = {
+            genome_name(f): f for f in sorted(os.listdir(folder))
+            if f.endswith(FASTA_EXTENSIONS) and os.path.isfile(os.path.join(folder, f))
+        }
+
+    def names(self):
+        """Names of all the genomes in the store"""
+        return list(self.files)
+
+    def open(self, name):
+        """Binary file object with the FASTA of a genome"""
+        return open(self.path(name), 'rb')
+
+    def path(self, name):
+        """Path to the FASTA file of a genome"""
+        return os.path.join(self.folder, self.files[name])
+
+    def materialise(self, name, out_dir, mode='hardlink'):
+        """Places {name}.fa in out_dir and returns its path"""
+        out_path = os.path.join(out_dir, f'{name}.fa')
+        link_file(self.path(name), out_path, mode)
+
+        return out_path
+
+    def close(self):
+        pass
+
+
+class ZipGenomeStore:
+    """Genome store backed by a zip archive, read in place"""
+
+    def __init__(self, zip_path, backing_dir=None):
+        self.zip_path = zip_path
+        self.backing_dir = backing_dir or os.path.splitext(zip_path)[0]
+        self.zip_ref = zipfile.ZipFile(zip_path, 'r')
+        self.members = {
+            genome_name(info.filename): info for info in self.zip_ref.infolist()
+            if not info.is_dir() and info.filename.endswith(FASTA_EXTENSIONS)
+        }
+        self.lock = threading.Lock()  # Guards the shared archive handle
+
+    def names(self):
+        """Names of all the genomes in the store"""
+        return list(self.members)
+
+    def open(self, name):
+        """Binary file object streaming the FASTA of a genome from the archive"""
+        return self.zip_ref.open(self.members[name])
+
+    def extract(self, name, out_path):
+        """Writes the FASTA of a genome to out_path without extracting any other member"""
+        info = self.members[name]
+        tmp_path = f'{out_path}.{threading.get_ident()}.part'
+
+        with open(tmp_path, 'wb') as dst:
+            if info.compress_type == zipfile.ZIP_STORED:
+                # Stored members are plain byte ranges of the archive: skip the local header and copy them
+                with open(self.zip_path, 'rb') as src:
+                    src.seek(info.header_offset)
+                    header = src.read(30)
+                    name_len = int.from_bytes(header[26:28], 'little')
+                    extra_len = int.from_bytes(header[28:30], 'little')
+                    data_offset = info.header_offset + 30 + name_len + extra_len
+                    copy_range(src, data_offset, info.file_size, dst)
+            else:
+                with self.lock, self.zip_ref.open(info) as src:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+        os.replace(tmp_path, out_path)
+        return out_path
+
+    def path(self, name):
+        """Path to the FASTA of a genome in the backing folder, extracting it the first time it is needed"""
+        out_path = os.path.join(self.backing_dir, f'{name}.fa')
+        if not os.path.exists(out_path):
+            os.makedirs(self.backing_dir, exist_ok=True)
+            self.extract(name, out_path)  # Concurrent extractions of a genome write the same content
+
+        return out_path
+
+    def materialise(self, name, out_dir, mode='hardlink'):
+        """Places {name}.fa in out_dir and returns its path. Copies are streamed from the archive directly"""
+        out_path = os.path.join(out_dir, f'{name}.fa')
+        if mode == 'copy':
+            return self.extract(name, out_path)
+
+        link_file(self.path(name), out_path, mode)
+        return out_path
+
+    def close(self):
+        self.zip_ref.close()
+
+
+def open_store(path):
+    """Opens a genome store from a zip archive or a folder. Uses the extracted folder if the archive is missing"""
+    if os.path.isdir(path):
+        return DirGenomeStore(path)
+
+    if path.endswith('.zip') and os.path.isdir(path[:-len('.zip')]) and not os.path.exists(path):
+        return DirGenomeStore(path[:-len('.zip')])
+
+    return ZipGenomeStore(path)
+
+
+def write_store_archive(folder, zip_path, compress=False):
+    """
+    Writes the FASTA files of a folder into a zip archive. Uncompressed archives (default) let the genome store
+    read members as plain byte ranges
+    """
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    tmp_path = f'{zip_path}.part'
+
+    with zipfile.ZipFile(tmp_path, 'w', compression=compression, allowZip64=True) as zip_ref:
+        for f in sorted(os.listdir(folder)):
+            if f.endswith(FASTA_EXTENSIONS):
+                zip_ref.write(os.path.join(folder, f), arcname=f)
+
+    os.replace(tmp_path, zip_path)
+    return zip_path
+
+
+def stage_genomes(store, assignments, mode='hardlink', workers=8):
+    """
+    Materialises every genome of a {genome: output_folder} dictionary with the given link mode.
+    Output folders are created on demand. Genomes are placed in parallel, which mostly helps when they
+    have to be copied or extracted from an archive. Returns a {genome: output_path} dictionary
+    """
+    for folder in set(assignments.values()):
+        os.makedirs(folder, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            genome: pool.submit(store.materialise, genome, folder, mode)
+            for genome, folder in assignments.items()
+        }
+
+    return {genome: future.result() for genome, future in futures.items()}
+
+
+def write_manifest(staged, assignments, manifest_path):
+    """Writes a Genome / Group / Path TSV manifest of staged genomes"""
+    with open(manifest_path, 'w') as file:
+        file.write('Genome\tGroup\tPath\n')
+        for genome in sorted(staged):
+            file.write(f'{genome}\t{assignments[genome]}\t{staged[genome]}\n')
+
+
+def read_manifest(manifest_path):
+    """Reads a staging manifest into a {group: [genome paths]} dictionary"""
+    groups = {}
+    with open(manifest_path, 'r') as file:
+        next(file)  # Header
+        for line in file:
+            genome, group, path = line.rstrip('\n').split('\t')
+            groups.setdefault(group, []).append(path)
+
+    return groups
@@ -9,22 +9,32 @@ Date: 2025-11-07
 Version: 1.0
 
 Usage:
-    python genomes_download.py
+    python genomes_download.py [--refresh]
 
 Output:
     - SAR11_genomes.zip with FASTA sequences of filtered genomes
     - IMG_Genome_IDs.txt with identifiers of the genomes if their FASTA sequences were not found in RefSeq
+    - genome_cache/ folder with every downloaded genome, reused by later runs
 
 Dependencies:
+    - genome_cache (this repository)
+    - genome_registry (this repository)
+    - genome_store (this repository)
+    - ncbi_downloader (this repository)
     - os
-    - pandas
-    - requests
     - shutil
+    - sys
     - zipfile
 
 Notes:
-    - Accepts no arguments
+    - Only accepts the optional --refresh flag, which re-downloads cached genomes older than cache_max_age days or
+      whose checksum does not match, instead of serving them from the cache
+    - Genomes already in the cache are never downloaded again, so an interrupted run resumes where it stopped
+      and changing the thresholds only reselects genomes from the cache
     - Contamination and completeness thresholds must be changed directly in the code
+    - Genomes are downloaded concurrently and in batches. Number of workers, request rate and batch size can be
+      changed directly in the code
+    - An NCBI API key can be given in the NCBI_API_KEY environment variable to raise the allowed request rate
     - Requires SAR11_genomes_1.zip with all the genomes from the reference article, which can be directly dowloaded from 
       https://figshare.com/articles/dataset/New_SAR11_isolate_genomes_from_the_tropical_Pacific_Ocean/28087454/1
     - Requires Genomes_table.txt with the supplementary table S3 from the reference article, which can be downloaded from
@@ -35,54 +45,42 @@ Notes:
 comp_th = 90
 cont_th = 5
 
+# Download settings - might be changed by the user
+workers = 8     # Concurrent downloads
+rate_limit = 3  # Maximum requests per second sent to NCBI (up to 10 if NCBI_API_KEY is set)
+batch_size = 20 # Accessions requested in a single NCBI archive (1 to request genomes one by one)
+
+# Genome cache settings - might be changed by the user
+cache_dir = 'genome_cache'  # Persistent folder with all downloaded genomes
+cache_max_age = 180         # Days after which a cached genome is considered stale by --refresh
+compress_archive = False    # Uncompressed SAR11_genomes.zip members are read in place by later steps
+
 
 ## LIBRARIES
-import pandas as pd 
-import requests
 import zipfile
 import os
 import shutil
+import sys
 
+from genome_cache import GenomeCache
+from genome_registry import GenomeRegistry, data_filtering
+from genome_store import write_store_archive
+from ncbi_downloader import download_genomes, copy_zip_member
 
-## FUNCTIONS
-def data_filtering(data, comp_th, cont_th):
-    """Filters a dataset accoriding to completeness and contamination thresholds"""
-
-    data = data.copy()
-    
-    group_list = list(data["Subgroup"])
-    groups = list(set(data["Subgroup"].dropna()))
-
-    # Transform into numeric
-    data["Completeness"] = data["Completeness"].astype(str).str.replace(',', '.')
-    data["Contamination"] = data["Contamination"].astype(str).str.replace(',', '.')
-
-    data["Completeness"] = pd.to_numeric(data["Completeness"], errors='coerce')
-    data["Contamination"] = pd.to_numeric(data["Contamination"], errors='coerce')
 
-    # Apply filters
-    sset = data[(data["Completeness"] >= comp_th) & (data["Contamination"] <= cont_th)]
-    group_sset_list = list(sset["Subgroup"])
-
-    print('Total maintained:', len(group_sset_list),'\n')
-    
-    # Calculate metrics
-    for g in groups:
-        count = group_list.count(g)
-        sset_count = group_sset_list.count(g)
+## MAIN PROGRAM 
 
-        fraction = f'{sset_count}/{count}'
-        percentage = round(sset_count / count * 100,2)
+# Check arguments
+if any(arg != '--refresh' for arg in sys.argv[1:]):
+    print('Use: genomes_download.py [--refresh]')
+    sys.exit(1)
 
-        print(f'{fraction} ({percentage}%) samples are maintained for group {g}!')
-    
-    return sset
+refresh = '--refresh' in sys.argv[1:]
 
 
-## MAIN PROGRAM 
-
 ### Read RefSeq data
-df = pd.read_csv("Genomes_table.txt", sep = '\t')
+registry = GenomeRegistry.from_table("Genomes_table.txt")
+df = registry.table
 df = df[(~(df["Category"] == "Outgroup")) & (~(df["Category"] == "This study"))]
 print(df.shape)
 df.head()
@@ -100,12 +98,8 @@ print(f'{len(ids)} genomes found!\n')
 
 
 # Filter RefSeq IDs and IMG Genome ID
-IMG_IDs = []  
-
-for ID in ids:
-    if ID.endswith('*'):
-        IMG_IDs.append(ID)
-        ids.remove(ID)
+IMG_IDs = [ID for ID in ids if ID.endswith('*')]
+ids = [ID for ID in ids if not ID.endswith('*')]
 
 filename = 'IMG_Genome_IDs.txt'
 
@@ -127,65 +121,45 @@ if not os.path.exists(path):
 
 # Retrieve sequences
 RefSeq = ids
+targets = {}
 for acc in RefSeq:
+    SAG = registry.accession(acc)["SAG or Isolate ID"]
+    group = registry.accession(acc)["Subgroup"]
+    new_filename = f'{SAG}_{group}.fa'
+    targets[acc] = os.path.join(path, new_filename)
 
-    filename = f'{acc}.zip'
-    original_path = os.path.join(os.getcwd(), acc)
-    fasta_subpath = f'{acc}/ncbi_dataset/data/{acc}/'
-    fasta_path = os.path.join(os.getcwd(), fasta_subpath)
-    
-    # Access genome files
-    url = (
-        f'https://api.ncbi.nlm.nih.gov/datasets/v2alpha/genome/accession/{acc}/download'
-        f'?include_annotation_type=GENOME_FASTA'
-    )
-
-    response = requests.get(url)
-
-    if not response.ok:
-        print(f'There was an error when searching {acc} in RefSeq')
-    
-    # Write zip 
-    with open(filename, 'wb') as file:
-        file.write(response.content)
-          
-    # Unzip information
-    try:
-        with zipfile.ZipFile(filename, "r") as zip_ref:
-            zip_ref.extractall(acc)
-            print(f"Extracted: {acc}/")        
-        os.remove(filename)
-    
-    except:
-        print(f'Error reading {filename}')
-        print(f'Skipping ...')
-        continue
-
-    if not os.path.exists(fasta_path):
-        print(f'Error: no fasta file found for {acc}')
-        continue
-        
-    # Move fasta to common directory
-    for f in os.listdir(fasta_path):
-        if f.endswith('.fa') or f.endswith('.fasta') or f.endswith('.fna'):
-            SAG = filt_data.loc[filt_data["RefSeq Assembly (*IMG Genome ID)"] == acc, "SAG or Isolate ID"].iloc[0]
-            group = filt_data.loc[filt_data["RefSeq Assembly (*IMG Genome ID)"] == acc, "Subgroup"].iloc[0]
-            new_filename = f'{SAG}_{group}.fa'
-            new_filepath = os.path.join(path, new_filename)
-            shutil.move(os.path.join(fasta_path, f), new_filepath)
-            print(f'Succesfully moved: {f} --> {path}\n')
-    
-    # Delete info
-    shutil.rmtree(original_path)    
+# Genomes already cached are not downloaded again
+cache = GenomeCache(cache_dir, max_age_days=cache_max_age)
+
+if refresh:
+    to_fetch = [acc for acc in targets if cache.is_stale(acc) or not cache.verify(acc)]
+else:
+    to_fetch = [acc for acc in targets if not cache.has(acc)]
+
+print(f'{len(targets) - len(to_fetch)} genomes found in {cache_dir}, {len(to_fetch)} to download')
+
+incoming = {acc: cache.incoming_path(acc) for acc in to_fetch}
+failed = download_genomes(
+    incoming, workers=workers, rate=rate_limit, batch_size=batch_size,
+    on_complete=lambda acc: cache.add(acc, incoming[acc])
+)
+
+if failed:
+    print(f'{len(failed)} genomes could not be retrieved: {", ".join(failed)}')
+
+# Copy selected genomes from the cache (failed refreshes keep their previous cached version)
+for acc, out_path in targets.items():
+    if cache.has(acc):
+        cache.materialise(acc, out_path)
 
 
 # ### Article data
-df2 = pd.read_csv("Genomes_table.txt", sep = '\t')
+df2 = registry.table
 sset2 = df2[df2["Category"] == "This study"]
 study_data_filt = data_filtering(sset2, comp_th, cont_th)
 
 
-# Delete all study genomes that do not follow criteria
+# Study genomes that do not follow criteria are not extracted
 isolate_IDs = sset2["SAG or Isolate ID"].tolist()
 filt_isolate_IDs = study_data_filt["SAG or Isolate ID"].tolist()
 to_delete_IDs = list(set(isolate_IDs)-set(filt_isolate_IDs))
@@ -194,36 +168,31 @@ to_delete_IDs = list(set(isolate_IDs)-set(filt_isolate_IDs))
 study_genomes_dirname = 'SAR11_Genomes_1.zip'
 study_genomes_path = os.path.join(os.getcwd(), study_genomes_dirname)
 
-# Unzip folder
+# Extract only the genomes that follow criteria, adding group info to their names
 with zipfile.ZipFile(study_genomes_path, "r") as zip_ref:
-        zip_ref.extractall(path)
-
-# Remove specific fasta files
-for name in to_delete_IDs:
-    
-    filename = f'{name}.fa'
-    fasta_path = os.path.join(path, filename)
-    
-    os.remove(fasta_path)
-
-# Rename remaining files to add group info
-for name in filt_isolate_IDs:
-    
-    filename = f'{name}.fa'
-    fasta_path = os.path.join(path, filename)
-    
-    group = study_data_filt.loc[study_data_filt["SAG or Isolate ID"] == name, "Subgroup"].iloc[0]
-    new_filename = f'{name}_{group}.fa'
-    new_filepath = os.path.join(path, new_filename)
-    
-    shutil.move(fasta_path, new_filepath)
+    members = {os.path.basename(m): m for m in zip_ref.namelist() if not m.endswith('/')}
+
+    for name in filt_isolate_IDs:
+
+        filename = f'{name}.fa'
+        if filename not in members:
+            print(f'Error: {filename} not found in {study_genomes_dirname}')
+            continue
+
+        group = registry.isolate(name)["Subgroup"]
+        new_filename = f'{name}_{group}.fa'
+        new_filepath = os.path.join(path, new_filename)
+
+        copy_zip_member(zip_ref, members[filename], new_filepath)
+
+print(f'{len(to_delete_IDs)} study genomes discarded')
 
 
 # In[ ]:
 
 
 output_name = "SAR11_genomes"
-shutil.make_archive(output_name, 'zip', path)
+write_store_archive(path, f'{output_name}.zip', compress=compress_archive)
 print(f"\nFolder: {output_name}.zip created!")
 
 shutil.rmtree(path) 
@@ -0,0 +1,164 @@
+"""
+gtdb_client.py
+----------------------
+GTDB API client used by GTDB_processer.py. The taxon history of many genomes is retrieved by a bounded pool of
+worker threads sharing a keep-alive session, with retries and backoff on throttling (see http_pool.py).
+Responses are stored in a local SQLite cache keyed by accession and GTDB release, so reruns only query the API
+for genomes not seen before (or whose cached answer has expired). Genomes without GTDB information are cached
+too, so they are not asked for again until their entry expires.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from gtdb_client import GTDBClient
+    client = GTDBClient("gtdb_cache.sqlite", release="R226")
+    histories = client.taxon_history(["GCF_000012345.1", ...])  # {accession: list of entries, [] or None}
+    client.close()
+
+Output:
+    - gtdb_cache.sqlite cache with one row per (accession, release): HTTP status, JSON body and download time
+
+Dependencies:
+    - http_pool (this repository)
+    - concurrent.futures
+    - json
+    - sqlite3
+    - time
+
+Notes:
+    - Not meant to be run directly, it is imported by GTDB_processer.py
+    - taxon_history returns [] for genomes GTDB has no information about, and None when the API could not be
+      reached (after all retries). Only the first case is cached
+    - Cached answers expire after ttl_days (negative_ttl_days for genomes without information). Changing the
+      release label makes every genome be queried again
+    - Answers are committed to the cache in batches of COMMIT_BATCH while the queries run (and the last batch when
+      the run stops), so an interrupted run keeps every answer it already received
+"""
+
+## LIBRARIES
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from http_pool import make_session, RateLimiter, get_with_retry, RETRY_STATUS
+
+
+GTDB_URL = 'https://gtdb-api.ecogenomic.org/genome/{acc}/taxon-history'
+DAY = 86400
+COMMIT_BATCH = 20  # Fetched answers committed to the cache at once
+
+
+## FUNCTIONS
+class GTDBCache:
+    """SQLite cache of GTDB API answers keyed by (accession, release)"""
+
+    def __init__(self, path, ttl_days=90, negative_ttl_days=30):
+        self.connection = sqlite3.connect(path)
+        self.ttl = ttl_days * DAY if ttl_days is not None else None
+        self.negative_ttl = negative_ttl_days * DAY if negative_ttl_days is not None else None
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS taxon_history ('
+            'accession TEXT NOT NULL, release TEXT NOT NULL, status INTEGER NOT NULL, body TEXT NOT NULL, '
+            'fetched REAL NOT NULL, PRIMARY KEY (accession, release))'
+        )
+        self.connection.commit()
+
+    def get(self, accession, release):
+        """Cached entries of an accession (possibly []), or None if it is not cached or has expired"""
+        row = self.connection.execute(
+            'SELECT body, fetched FROM taxon_history WHERE accession = ? AND release = ?', (accession, release)
+        ).fetchone()
+        if row is None:
+            return None
+
+        data = json.loads(row[0])
+        ttl = self.ttl if data else self.negative_ttl
+        if ttl is not None and time.time() - row[1] > ttl:
+            return None
+
+        return data
+
+    def put_many(self, rows):
+        """Stores (accession, release, status, data) answers in a single transaction"""
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO taxon_history VALUES (?, ?, ?, ?, ?)',
+                [(acc, release, status, json.dumps(data), now) for acc, release, status, data in rows]
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def fetch_history(session, limiter, accession):
+    """
+    Queries the taxon history of an accession. Returns (status, entries): entries is [] when GTDB has no
+    information for it, and None when the API could not be reached or kept failing
+    """
+    try:
+        response = get_with_retry(session, GTDB_URL.format(acc=accession), limiter)
+    except Exception as e:
+        print(f'Error querying GTDB for {accession}: {e}')
+        return None, None
+
+    with response:
+        if response.status_code in RETRY_STATUS:
+            return response.status_code, None
+        if not response.ok:
+            return response.status_code, []
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+
+class GTDBClient:
+    """Cached, concurrent access to the GTDB taxon history of genome accessions"""
+
+    def __init__(self, cache_path, release, workers=8, rate=5, ttl_days=90, negative_ttl_days=30):
+        self.release = release
+        self.workers = workers
+        self.cache = GTDBCache(cache_path, ttl_days, negative_ttl_days)
+        self.session = make_session(pool_size=workers)
+        self.limiter = RateLimiter(rate)
+        self.hits = 0
+        self.fetched = 0
+
+    def taxon_history(self, accessions):
+        """{accession: entries} for a list of accessions (see fetch_history), using the cache when possible"""
+        histories = {}
+        missing = []
+        for accession in dict.fromkeys(accessions):
+            data = self.cache.get(accession, self.release)
+            if data is None:
+                missing.append(accession)
+            else:
+                histories[accession] = data
+        self.hits += len(histories)
+
+        rows = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(fetch_history, self.session, self.limiter, acc): acc for acc in missing}
+                for future in as_completed(futures):
+                    accession = futures[future]
+                    status, data = future.result()
+                    histories[accession] = data
+                    self.fetched += 1
+                    if data is not None:
+                        rows.append((accession, self.release, status, data))
+                    if len(rows) >= COMMIT_BATCH:
+                        self.cache.put_many(rows)
+                        rows = []
+        finally:  # Answers received before an interruption are kept
+            self.cache.put_many(rows)
+
+        return histories
+
+    def close(self):
+        self.session.close()
+        self.cache.close()
@@ -0,0 +1,189 @@
+"""
+gtdb_index.py
+----------------------
+Offline GTDB classification source used by GTDB_processer.py (offline mode). The GTDB release files
+(bac120_metadata / bac120_taxonomy TSV, plain or gzipped) are stream-parsed once into a SQLite index that maps
+version-stripped accessions to their GTDB lineage. Lookups are local and give the same entries as the GTDB API
+taxon history ({release, d, p, c, o, f, g, s}), so GTDB_classification.json keeps the same format.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from gtdb_index import GTDBIndex
+    index = GTDBIndex.build_or_open("gtdb_index.sqlite", ["bac120_metadata_r226.tsv.gz"], release="R226")
+    histories = index.taxon_history(["GCF_000012345.1", ...])  # {accession: [entry] or []}
+    index.close()
+
+Output:
+    - gtdb_index.sqlite file with the accession -> lineage index and the files it was built from
+
+Dependencies:
+    - gzip
+    - json
+    - os
+    - sqlite3
+
+Notes:
+    - Not meant to be run directly, it is imported by GTDB_processer.py
+    - Accessions are matched without database prefix (RS_, GB_) and version (.1), and GCA_/GCF_ accessions with
+      the same number are considered the same assembly
+    - The index is rebuilt automatically when the release files change (different names, sizes or modification times)
+"""
+
+## LIBRARIES
+import gzip
+import json
+import os
+import sqlite3
+
+
+RANKS = ("d", "p", "c", "o", "f", "g", "s")
+BATCH_ROWS = 100_000   # Rows inserted per transaction while building the index
+
+
+## FUNCTIONS
+def accession_key(accession):
+    """Accession without database prefix and version, with GCA_/GCF_ unified (RS_GCF_000001.2 -> GC_000001)"""
+    key = str(accession).strip()
+    if key[:3] in ('RS_', 'GB_'):
+        key = key[3:]
+    if key[:4] in ('GCA_', 'GCF_'):
+        key = 'GC_' + key[4:]
+
+    return key.split('.')[0]
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path, 'r')
+
+
+def read_lineages(path):
+    """
+    Yields (accession, taxonomy string) pairs of a GTDB release file: bac120_metadata (header with accession and
+    gtdb_taxonomy columns) or bac120_taxonomy (two columns, no header)
+    """
+    with open_text(path) as file:
+        first = file.readline().rstrip('\n').split('\t')
+        if 'accession' in first and 'gtdb_taxonomy' in first:
+            acc_col, tax_col = first.index('accession'), first.index('gtdb_taxonomy')
+        else:
+            acc_col, tax_col = 0, 1
+            if len(first) > 1:
+                yield first[0], first[1]
+
+        for line in file:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) > max(acc_col, tax_col):
+                yield fields[acc_col], fields[tax_col]
+
+
+def lineage_entry(taxonomy, release):
+    """Taxon history entry of a GTDB taxonomy string, with the same keys as the GTDB API"""
+    entry = {"release": release}
+    entry.update({rank: f'{rank}__' for rank in RANKS})
+    for taxon in taxonomy.split(';'):
+        taxon = taxon.strip()
+        if taxon[:1] in RANKS:
+            entry[taxon[0]] = taxon
+
+    return entry
+
+
+def source_signature(paths):
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append({"file": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+
+    return signature
+
+
+class GTDBIndex:
+    """SQLite accession -> GTDB lineage index"""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+
+    @classmethod
+    def build_or_open(cls, path, sources, release):
+        """Opens the index at path, building it first if it is missing or was built from other files or release"""
+        signature = json.dumps({"release": release, "sources": source_signature(sources)})
+
+        if os.path.exists(path):
+            index = cls(path)
+            try:
+                row = index.connection.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+            except sqlite3.DatabaseError:
+                row = None
+            if row is not None and row[0] == signature:
+                return index
+            index.close()
+
+        tmp_path = f'{path}.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        index = cls(tmp_path)
+        count = index.build(sources, release, signature)
+        index.close()
+        os.replace(tmp_path, path)
+        print(f'GTDB index built: {count} genomes ({path})')
+
+        return cls(path)
+
+    def build(self, sources, release, signature):
+        """Fills an empty index from the release files. Returns the number of genomes indexed"""
+        connection = self.connection
+        connection.execute('CREATE TABLE lineage (accession TEXT PRIMARY KEY, taxonomy TEXT NOT NULL) WITHOUT ROWID')
+        connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+        count = 0
+        for source in sources:
+            batch = []
+            for accession, taxonomy in read_lineages(source):
+                batch.append((accession_key(accession), taxonomy))
+                if len(batch) >= BATCH_ROWS:
+                    with connection:
+                        connection.executemany('INSERT OR REPLACE INTO lineage VALUES (?, ?)', batch)
+                    count += len(batch)
+                    batch = []
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO lineage VALUES (?, ?)', batch)
+            count += len(batch)
+
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)', [("signature", signature), ("release", release)]
+            )
+
+        return count
+
+    def release(self):
+        return self.connection.execute("SELECT value FROM meta WHERE key = 'release'").fetchone()[0]
+
+    def lineage(self, accession):
+        """Taxon history entry of an accession, or None if it is not in the release"""
+        row = self.connection.execute(
+            'SELECT taxonomy FROM lineage WHERE accession = ?', (accession_key(accession),)
+        ).fetchone()
+        if row is None:
+            return None
+
+        return lineage_entry(row[0], self.release())
+
+    def taxon_history(self, accessions):
+        """{accession: [entry] or []} for a list of accessions, as GTDBClient.taxon_history returns"""
+        histories = {}
+        for accession in dict.fromkeys(accessions):
+            entry = self.lineage(accession)
+            histories[accession] = [entry] if entry is not None else []
+
+        return histories
+
+    def close(self):
+        self.connection.close()
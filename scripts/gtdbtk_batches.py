@@ -0,0 +1,244 @@
+"""
+gtdbtk_batches.py
+----------------------
+Runs GTDB-Tk on the genomes without GTDB classification (unclassified_gtdb/ from GTDB_processer.py) and merges
+its results with GTDB_classification.json, replacing GTDB_Classification_Processer.ipynb.
+Genomes are split into batches of similar total size, the batches are run as concurrent GTDB-Tk classify_wf jobs
+within a CPU and memory budget, and every batch summary found is merged in a single vectorised pass.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    python gtdbtk_batches.py unclassified_gtdb/ GTDB_classification.json
+    python gtdbtk_batches.py unclassified_gtdb/ GTDB_classification.json --merge-only
+
+Output:
+    - gtdbtk_batches/batches.tsv with the batch of each genome
+    - gtdbtk_batches/batch_{i}/ folders with the genomes (hardlinks), the GTDB-Tk output and log of each batch
+    - GTDB_full_classification.json with the GTDB classification of all genomes (API and GTDB-Tk)
+
+Dependencies:
+    - genome_store (this repository)
+    - pandas
+    - concurrent.futures
+    - glob
+    - json
+    - os
+    - re
+    - shutil
+    - subprocess
+    - sys
+
+Notes:
+    - Batches with a finished summary (gtdbtk.bac120.summary.tsv) are skipped on rerun. If genomes are added or
+      removed, finished batches are kept and only the remaining genomes are planned again into new batches
+    - Batch summaries are discovered with the summary_globs patterns, so the gtdbtk.bac120.summary_{n}.tsv files
+      of batches run by hand are merged too
+    - Genomes GTDB-Tk leaves unclassified get empty ranks (d__, p__, ..., s__)
+    - GTDB-Tk command, batch size and CPU/memory budget can be changed directly in the code
+"""
+
+# To be changed by user
+gtdbtk_bin = "gtdbtk"
+gtdbtk_extra_args = ["--skip_ani_screen"]
+genomes_per_batch = 1000
+cpus_per_batch = 16
+memory_per_batch_gb = 120       # Peak memory of one classify_wf job (pplacer)
+total_cpus = None               # None = all available CPUs
+total_memory_gb = 256
+batch_dir = "gtdbtk_batches"
+summary_globs = [f"{batch_dir}/batch_*/out/gtdbtk.bac120.summary.tsv", "gtdbtk.bac120.summary_*.tsv"]
+out_filename = "GTDB_full_classification.json"
+
+
+## LIBRARIES
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from genome_store import link_file, open_store
+
+
+RANKS = ("d", "p", "c", "o", "f", "g", "s")
+
+
+## FUNCTIONS
+def plan_batches(sizes, n_batches, first=1):
+    """Assigns genomes ({name: bytes}) to n_batches (numbered from first) of similar total size, largest first"""
+    totals = [0] * n_batches
+    batches = {}
+    for name in sorted(sizes, key=lambda name: (-sizes[name], name)):
+        batch = totals.index(min(totals))
+        batches[name] = batch + first
+        totals[batch] += sizes[name]
+
+    return batches
+
+
+def read_plan(path):
+    if not os.path.exists(path):
+        return {}
+    plan = pd.read_csv(path, sep='\t', dtype={"Genome": str})
+    return dict(zip(plan["Genome"], plan["Batch"]))
+
+
+def write_plan(batches, path):
+    plan = pd.DataFrame({"Genome": list(batches), "Batch": list(batches.values())}).sort_values(["Batch", "Genome"])
+    plan.to_csv(path, sep='\t', index=False)
+
+
+def summary_path(batch):
+    return os.path.join(batch_dir, f'batch_{batch}', 'out', 'gtdbtk.bac120.summary.tsv')
+
+
+def run_batch(batch, genomes, store, cpus):
+    """Links the genomes of a batch into its folder and runs GTDB-Tk classify_wf on them"""
+    folder = os.path.join(batch_dir, f'batch_{batch}')
+    genome_dir = os.path.join(folder, 'genomes')
+    shutil.rmtree(genome_dir, ignore_errors=True)  # Links left by a previous plan
+    os.makedirs(genome_dir)
+    for name in genomes:
+        link_file(store.path(name), os.path.join(genome_dir, f'{name}.fa'))
+
+    command = [
+        gtdbtk_bin, "classify_wf", "--genome_dir", genome_dir, "--out_dir", os.path.join(folder, 'out'),
+        "--extension", "fa", "--cpus", str(cpus), *gtdbtk_extra_args
+    ]
+    with open(os.path.join(folder, 'gtdbtk.log'), 'w') as log:
+        subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, check=True)
+
+    if not os.path.exists(summary_path(batch)):  # No bacterial genome classified
+        raise RuntimeError(f'GTDB-Tk finished without {summary_path(batch)}')
+
+
+def run_batches(pending, plan, store):
+    """Runs the pending batches concurrently within the CPU and memory budget. Returns the failed batches"""
+    cpus = total_cpus or os.cpu_count() or 1
+    n_jobs = max(1, min(cpus // cpus_per_batch, int(total_memory_gb // memory_per_batch_gb)))
+    print(f'Running {len(pending)} GTDB-Tk batches, {n_jobs} at a time ({cpus_per_batch} CPUs each)')
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        futures = {
+            pool.submit(run_batch, batch, sorted(g for g, b in plan.items() if b == batch), store, cpus_per_batch): batch
+            for batch in pending
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                future.result()
+            except (subprocess.CalledProcessError, OSError, RuntimeError) as e:
+                print(f'Error in batch {batch}: {e}. Check {batch_dir}/batch_{batch}/gtdbtk.log')
+                failed.append(batch)
+                continue
+            print(f'Batch {batch} finished')
+
+    return failed
+
+
+def natural_key(path):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', path)]
+
+
+def find_summaries(patterns=summary_globs):
+    """Batch summary files matching the glob patterns, in batch number order"""
+    found = []
+    for pattern in patterns:
+        found += sorted(glob.glob(pattern), key=natural_key)
+
+    return list(dict.fromkeys(found))
+
+
+def merge_summaries(paths):
+    """
+    {genome: {d, p, c, o, f, g, s}} of the GTDB-Tk summaries. The classification column of all the summaries is
+    split into rank columns at once (later summaries win for repeated genomes)
+    """
+    frames = [pd.read_csv(path, sep='\t', usecols=["user_genome", "classification"], dtype=str) for path in paths]
+    if not frames:
+        return {}
+
+    summary = pd.concat(frames, ignore_index=True).drop_duplicates("user_genome", keep="last")
+    classified = summary["classification"].fillna('').str.startswith('d__')
+    taxa = summary["classification"].where(classified, '').str.split(';', expand=True)
+
+    # Ranks are in d..s order. Unclassified genomes and missing ranks get the empty rank name (s__)
+    ranks = pd.DataFrame(index=summary.index)
+    for i, rank in enumerate(RANKS):
+        column = taxa[i] if i in taxa.columns else pd.Series(None, index=summary.index, dtype=object)
+        ranks[rank] = column.where(column.fillna('').str.startswith(f'{rank}__'), f'{rank}__')
+    ranks.index = summary["user_genome"]
+
+    return ranks.to_dict('index')
+
+
+## MAIN PROGRAM
+if __name__ == '__main__':
+
+    # Check arguments
+    args = [a for a in sys.argv[1:] if a != '--merge-only']
+    merge_only = '--merge-only' in sys.argv[1:]
+
+    if len(args) != 2:
+        print('Use: gtdbtk_batches.py unclassified_genomes_dir GTDB_classification.json [--merge-only]')
+        sys.exit(1)
+
+    genomes_path, gtdb_json = args
+    for path in args:
+        if not os.path.exists(path):
+            print(f'Error: {path} not found!')
+            sys.exit(1)
+
+    failed = []
+    if not merge_only:
+        store = open_store(genomes_path)
+        names = store.names()
+
+        # Batch plan: finished batches are kept, the rest of genomes are planned again if they changed
+        os.makedirs(batch_dir, exist_ok=True)
+        plan_path = os.path.join(batch_dir, 'batches.tsv')
+        plan = read_plan(plan_path)
+        finished = {batch for batch in set(plan.values()) if os.path.exists(summary_path(batch))}
+        done = {genome: batch for genome, batch in plan.items() if batch in finished}
+        todo = [name for name in names if name not in done]
+
+        if set(todo) != {genome for genome, batch in plan.items() if batch not in finished}:
+            sizes = {name: os.path.getsize(store.path(name)) for name in todo}
+            n_batches = -(-len(todo) // genomes_per_batch)
+            plan = {**done, **plan_batches(sizes, n_batches, first=max(finished, default=0) + 1)}
+            write_plan(plan, plan_path)
+
+        batches = sorted(set(plan.values()))
+        pending = [batch for batch in batches if batch not in finished]
+        print(f'{len(names)} genomes in {len(batches)} batches, {len(finished)} already finished')
+
+        if pending:
+            failed = run_batches(pending, plan, store)
+        store.close()
+
+    # Merge API and GTDB-Tk classifications
+    with open(gtdb_json, 'r') as file:
+        classification = json.load(file)
+    for value in classification.values():
+        value.pop("release", None)
+
+    summaries = find_summaries()
+    print(f'Merging {len(summaries)} GTDB-Tk summaries: {", ".join(summaries)}')
+    classification.update(merge_summaries(summaries))
+
+    with open(out_filename, 'w') as file:
+        json.dump(classification, file, indent=4)
+
+    print(f'\n{len(classification)} genomes classified. Results are available in {out_filename}')
+    if failed:
+        print(f'{len(failed)} batches failed ({", ".join(map(str, sorted(failed)))}). Run again to retry them')
+        sys.exit(1)
@@ -0,0 +1,121 @@
+"""
+http_pool.py
+----------------------
+Shared HTTP helpers for the scripts that query remote services (NCBI datasets API, GTDB API).
+Provides a keep-alive session with a bounded connection pool, a per-host rate limiter and
+a GET wrapper that retries with exponential backoff on throttling (429) and server errors (5xx).
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    from http_pool import make_session, RateLimiter, get_with_retry
+
+Dependencies:
+    - requests
+    - random
+    - threading
+    - time
+    - urllib
+
+Notes:
+    - Not meant to be run directly, it is imported by the download and classification scripts
+    - A single session and rate limiter should be shared by all the worker threads of a script
+"""
+
+## LIBRARIES
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# HTTP status codes that are worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+## FUNCTIONS
+def make_session(pool_size=8, headers=None):
+    """Creates a requests session whose connection pool can keep pool_size connections alive"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    if headers:
+        session.headers.update(headers)
+
+    return session
+
+
+class RateLimiter:
+    """Spaces the requests sent to each host so that no more than `rate` requests per second are sent"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        """Blocks until a request to the host of url is allowed"""
+        if not self.interval:
+            return
+
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def retry_delay(response, attempt, backoff):
+    """Seconds to wait before the next attempt: Retry-After header if given, exponential backoff otherwise"""
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return float(retry_after)
+
+    return backoff * 2 ** attempt + random.uniform(0, backoff)
+
+
+def get_with_retry(session, url, limiter=None, retries=5, backoff=1.0, timeout=60, **kwargs):
+    """
+    Sends a GET request, retrying on 429/5xx responses and connection errors.
+    Returns the last response received (which may not be ok) or raises the last connection error.
+    """
+    response = None
+    error = None
+
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.wait(url)
+
+        try:
+            response = session.get(url, timeout=timeout, **kwargs)
+            error = None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            response = None
+            error = e
+        else:
+            if response.status_code not in RETRY_STATUS:
+                return response
+
+        if attempt == retries:
+            break
+
+        delay = retry_delay(response, attempt, backoff)
+        if response is not None:
+            response.close()  # Release connection before sleeping
+        time.sleep(delay)
+
+    if error is not None:
+        raise error
+
+    return response
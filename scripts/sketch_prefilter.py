@@ -0,0 +1,326 @@
+"""
+sketch_prefilter.py
+----------------------
+MinHash prefilter for the all-vs-all fastANI step. Each genome is reduced to a bottom-s sketch of its hashed
+canonical k-mers, the Mash distance of every pair of genomes is estimated from the sketches, and only the pairs
+that may reach the clustering threshold (minus a safety margin) are handed to fastANI.
+Most SAR11 genome pairs are far below 95% ANI, so the large majority of fastANI comparisons are skipped.
+
+Author: Jorge Marcos Fernández
+Date: 2026-10-16
+Version: 1.0
+
+Usage:
+    python sketch_prefilter.py genomes_path ANI_th [margin]
+
+Output:
+    - sketch_index/ folder with the sketches of all genomes (sketches.npy, sizes.npy, names.txt, params.json).
+      It is updated incrementally: genomes already sketched are not read again
+    - fastANI_candidates/candidate_pairs.tsv with every candidate pair and its Mash-estimated ANI
+    - fastANI_candidates/block_{i}.txt genome lists. Candidate pairs are grouped into blocks (connected
+      components) and each block list is meant to be given to fastANI both as --ql and --rl
+    - fastANI_candidates/fastani_commands.sh with one fastANI command per block
+
+Dependencies:
+    - genome_store (this repository)
+    - ani_clustering (this repository)
+    - numpy
+    - scipy
+    - concurrent.futures
+    - json
+    - os
+    - sys
+
+Notes:
+    - genomes_path can be SAR11_genomes.zip or a folder with FASTA files
+    - Default margin is 5 ANI points below the clustering threshold (e.g. pairs with estimated ANI >= 90 are kept for a
+      95% threshold). Mash estimates are less precise than fastANI, so the margin should not be reduced much
+    - Genomes without any candidate pair are not compared at all: they cannot belong to any ANI group
+    - The Jaccard index of a pair is estimated as in Mash: from the bottom-s hashes of the union of both sketches,
+      counting how many of them are in both. Dividing the hashes shared by the whole sketches by their union would
+      underestimate it (and the ANI) for genomes of different sizes, such as incomplete or reduced genomes
+    - A table computed from the blocks only has fastANI values for the candidate pairs. It is only valid for
+      threshold clustering (ANI_grouping.py with a threshold >= ANI_threshold - margin): the skipped pairs are
+      missing, not below the threshold, so mean ANI between clades, ANI distributions and gap statistics
+      (ani_byclade.py) must be computed from a full all-vs-all table
+    - Blocks are connected components of the candidate pairs, so chains of candidates can join many genomes into a
+      single block whose all-vs-all comparisons are run. The number of comparisons is printed to check the saving
+"""
+
+# To be changed by user
+kmer_size = 21
+sketch_size = 2000
+seed = 42
+workers = 8
+fastani_threads = 4
+
+
+## LIBRARIES
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from ani_clustering import connected_components, group_nodes
+from genome_store import open_store
+
+
+# Nucleotide -> 2-bit code (4 = any other symbol, breaks k-mers)
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for i, base in enumerate(b'ACGT'):
+    BASE_CODES[base] = i
+    BASE_CODES[ord(chr(base).lower())] = i
+
+EMPTY_HASH = np.iinfo(np.uint64).max  # Padding of sketches with fewer than sketch_size hashes
+PAIR_CHUNK = 1 << 22                  # Hashes merged at once when estimating the Jaccard index of the pairs
+
+
+## FUNCTIONS
+def read_codes(fasta_path):
+    """Reads a FASTA file as an array of 2-bit nucleotide codes. Contigs are separated by an invalid code"""
+    parts = []
+    with open(fasta_path, 'rb') as file:
+        for line in file:
+            if line.startswith(b'>'):
+                parts.append(b'N')
+            else:
+                parts.append(line.strip())
+
+    return BASE_CODES[np.frombuffer(b''.join(parts), dtype=np.uint8)]
+
+
+def canonical_kmers(codes, k):
+    """2-bit encoded canonical k-mers (min of forward and reverse complement) of all valid windows"""
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+
+    valid = codes < 4
+    invalid_count = np.concatenate([[0], np.cumsum(~valid)])
+    window_ok = (invalid_count[k:] - invalid_count[:-k]) == 0
+
+    values = np.where(valid, codes, 0).astype(np.uint64)
+    forward = np.zeros(n, dtype=np.uint64)
+    reverse = np.zeros(n, dtype=np.uint64)
+    two = np.uint64(2)
+
+    for j in range(k):
+        window = values[j:j + n]
+        forward = (forward << two) | window
+        reverse |= (np.uint64(3) - window) << np.uint64(2 * j)
+
+    return np.minimum(forward, reverse)[window_ok]
+
+
+def mix64(values, seed=0):
+    """splitmix64 finalizer, spreads k-mer codes uniformly over 64-bit hashes"""
+    x = values + np.uint64(seed)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xbf58476d1ce4e5b9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94d049bb133111eb)
+    x ^= x >> np.uint64(31)
+
+    return x
+
+
+def sketch_genome(fasta_path, k=kmer_size, s=sketch_size, hash_seed=seed):
+    """Bottom-s MinHash sketch (sorted hashes) of a genome"""
+    hashes = np.unique(mix64(canonical_kmers(read_codes(fasta_path), k), hash_seed))
+    return hashes[:s]
+
+
+class SketchIndex:
+    """On-disk index with one bottom-s sketch per genome"""
+
+    def __init__(self, index_dir, k=kmer_size, s=sketch_size, hash_seed=seed):
+        self.index_dir = index_dir
+        self.params = {"k": k, "s": s, "seed": hash_seed}
+        self.names = []
+        self.sketches = np.empty((0, s), dtype=np.uint64)
+        self.sizes = np.empty(0, dtype=np.int64)
+
+        params_path = os.path.join(index_dir, 'params.json')
+        if os.path.exists(params_path):
+            with open(params_path, 'r') as file:
+                if json.load(file) == self.params:  # Sketches built with other parameters are not comparable
+                    self.load()
+
+    def load(self):
+        with open(os.path.join(self.index_dir, 'names.txt'), 'r') as file:
+            self.names = [line.rstrip('\n') for line in file]
+        self.sketches = np.load(os.path.join(self.index_dir, 'sketches.npy'))
+        self.sizes = np.load(os.path.join(self.index_dir, 'sizes.npy'))
+
+    def save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        np.save(os.path.join(self.index_dir, 'sketches.npy'), self.sketches)
+        np.save(os.path.join(self.index_dir, 'sizes.npy'), self.sizes)
+        with open(os.path.join(self.index_dir, 'names.txt'), 'w') as file:
+            for name in self.names:
+                file.write(f'{name}\n')
+        with open(os.path.join(self.index_dir, 'params.json'), 'w') as file:
+            json.dump(self.params, file)
+
+    def update(self, genome_paths, n_workers=workers):
+        """Sketches the genomes of a {name: fasta_path} dictionary that are not in the index yet"""
+        known = set(self.names)
+        new = [name for name in genome_paths if name not in known]
+        if not new:
+            return 0
+
+        s = self.params["s"]
+        rows = np.full((len(new), s), EMPTY_HASH, dtype=np.uint64)
+        sizes = np.zeros(len(new), dtype=np.int64)
+
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            paths = [genome_paths[name] for name in new]
+            args = ([self.params["k"]] * len(new), [s] * len(new), [self.params["seed"]] * len(new))
+            for i, sketch in enumerate(pool.map(sketch_genome, paths, *args)):
+                rows[i, :len(sketch)] = sketch
+                sizes[i] = len(sketch)
+
+        self.names += new
+        self.sketches = np.vstack([self.sketches, rows])
+        self.sizes = np.concatenate([self.sizes, sizes])
+
+        return len(new)
+
+    def select(self, names):
+        """Sub-index rows (sketches, sizes) of a list of genome names"""
+        position = {name: i for i, name in enumerate(self.names)}
+        rows = np.array([position[name] for name in names], dtype=np.int64)
+
+        return self.sketches[rows], self.sizes[rows]
+
+
+def shared_hashes(sketches, sizes):
+    """Number of hashes shared by every pair of sketches with at least one in common (upper triangle, i < j)"""
+    n = len(sketches)
+    valid = np.arange(sketches.shape[1]) < sizes[:, None]
+    rows = np.repeat(np.arange(n), sizes)
+    hash_ids = np.unique(sketches[valid], return_inverse=True)[1].ravel()
+
+    membership = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, hash_ids)), shape=(n, hash_ids.max() + 1 if len(rows) else 0)
+    )
+    shared = sparse.triu(membership @ membership.T, k=1).tocoo()
+
+    return shared.row, shared.col, shared.data
+
+
+def union_shared(sketches, i, j, s):
+    """
+    Mash Jaccard counts of the pairs (i, j): number of hashes in both sketches among the bottom-s hashes of the
+    union of the two sketches, and number of hashes in that bottom-s union (lower than s for small genomes)
+    """
+    shared = np.zeros(len(i), dtype=np.int64)
+    union = np.zeros(len(i), dtype=np.int64)
+    chunk = max(1, PAIR_CHUNK // (2 * s))
+
+    for start in range(0, len(i), chunk):
+        end = start + chunk
+        merged = np.sort(np.hstack([sketches[i[start:end]], sketches[j[start:end]]]), axis=1)
+        valid = merged != EMPTY_HASH
+        first = valid.copy()  # First copy of every hash of the union
+        first[:, 1:] &= merged[:, 1:] != merged[:, :-1]
+        in_bottom = np.cumsum(first, axis=1) <= s  # Union rank (a repeated hash has the rank of its first copy)
+
+        shared[start:end] = (valid & ~first & in_bottom).sum(axis=1)
+        union[start:end] = np.minimum(first.sum(axis=1), s)
+
+    return shared, union
+
+
+def mash_ani(shared, union, k=kmer_size):
+    """ANI (%) estimated from the Mash distance of a pair with `shared` hashes among the `union` bottom-s hashes"""
+    jaccard = shared / np.maximum(union, 1)
+    with np.errstate(divide='ignore'):
+        distance = -np.log(2 * jaccard / (1 + jaccard)) / k
+
+    return np.clip(100 * (1 - distance), 0, 100)
+
+
+def candidate_pairs(index, names, min_ani):
+    """Pairs of genomes whose Mash-estimated ANI is >= min_ani. Returns (i, j, ANI) arrays over names"""
+    sketches, sizes = index.select(names)
+    i, j, _ = shared_hashes(sketches, sizes)  # Pairs without any shared hash have Jaccard 0
+    shared, union = union_shared(sketches, i, j, index.params["s"])
+    ani = mash_ani(shared, union, index.params["k"])
+    keep = ani >= min_ani
+
+    return i[keep], j[keep], ani[keep]
+
+
+def write_candidates(out_dir, names, paths, i, j, ani):
+    """Writes the candidate pairs, the fastANI blocks (connected components of candidates) and their commands"""
+    os.makedirs(out_dir, exist_ok=True)
+
+    with open(os.path.join(out_dir, 'candidate_pairs.tsv'), 'w') as file:
+        file.write('Query\tReference\tMash ANI\n')
+        for a, b, value in zip(i, j, ani):
+            file.write(f'{names[a]}\t{names[b]}\t{value:.2f}\n')
+
+    labels = connected_components(i, j, len(names))
+    nodes = np.unique(np.concatenate([i, j]))
+    blocks = group_nodes(nodes, labels[nodes])
+
+    with open(os.path.join(out_dir, 'fastani_commands.sh'), 'w') as commands:
+        for num, block in enumerate(blocks, start=1):
+            block_path = os.path.abspath(os.path.join(out_dir, f'block_{num}.txt'))
+            with open(block_path, 'w') as file:
+                for node in block:
+                    file.write(f'{os.path.abspath(paths[names[node]])}\n')
+            commands.write(
+                f'fastANI --ql {block_path} --rl {block_path} -t {fastani_threads} '
+                f'-o {os.path.abspath(os.path.join(out_dir, f"fastANI_block_{num}.txt"))}\n'
+            )
+
+    return blocks
+
+
+## MAIN PROGRAM
+if __name__ == '__main__':
+
+    # Check arguments
+    if len(sys.argv) not in (3, 4):
+        print('Use: sketch_prefilter.py genomes_path ANI_threshold [margin]')
+        sys.exit(1)
+
+    genomes_path = sys.argv[1]
+    try:
+        ANI_th = float(sys.argv[2])
+        margin = float(sys.argv[3]) if len(sys.argv) == 4 else 5.0
+    except ValueError:
+        print('Error: ANI threshold and margin must be numbers')
+        sys.exit(1)
+
+    if not os.path.exists(genomes_path):
+        print(f'Error: {genomes_path} not found!')
+        sys.exit(1)
+
+    # Sketch genomes (fastANI needs the FASTA files on disk, archives are extracted once by the store)
+    store = open_store(genomes_path)
+    paths = {name: store.path(name) for name in store.names()}
+    names = list(paths)
+
+    index = SketchIndex('sketch_index')
+    added = index.update(paths)
+    index.save()
+    print(f'{added} genomes sketched, {len(names) - added} already in sketch_index/')
+
+    # Candidate pairs and fastANI blocks
+    i, j, ani = candidate_pairs(index, names, ANI_th - margin)
+    blocks = write_candidates('fastANI_candidates', names, paths, i, j, ani)
+
+    all_vs_all = len(names) ** 2
+    blocked = sum(len(block) ** 2 for block in blocks)
+    print(f'{len(i)} candidate pairs with Mash ANI >= {ANI_th - margin:g} in {len(blocks)} blocks')
+    print(f'fastANI comparisons: {blocked} instead of {all_vs_all} ({100 * (1 - blocked / max(all_vs_all, 1)):.1f}% fewer)')
+    print('\nRun fastANI_candidates/fastani_commands.sh and concatenate the fastANI_block_*.txt results')
+    print('The merged table only has the candidate pairs: use it for threshold clustering, not for ANI statistics')
+
+    store.close()
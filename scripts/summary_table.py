@@ -26,22 +26,28 @@ Output:
     - genomes_classification.tsv table
 
 Dependencies:
-    - networkx
+    - ani_clustering (this repository)
+    - ani_matrix (this repository)
+    - genome_registry (this repository)
     - pandas
     - sys
     - json
     
 Notes:
     - Requires all classification workflow to be previously executed
+    - The supplementary data table is read as a tab-separated file (datasets/suplemmentary_data.xlsx exported to TSV)
 """
 
 
 # PACKAGES
 import pandas as pd  
-import networkx as nx 
 import sys
 import json
 
+from ani_clustering import matrix_components, membership
+from ani_matrix import load_matrix
+from genome_registry import GenomeRegistry, index_by
+
 # CHECK ARGUMENTS
 num_args = len(sys.argv)
 
@@ -67,7 +73,7 @@ except Exception as e:
 genomes_table = sys.argv[2]
 
 try:
-    gen_df = pd.read_csv(genomes_table, sep = '\t')
+    registry = GenomeRegistry.from_table(genomes_table)
 except Exception as e:
     print(f'Error reading genomes table: {e}')
     sys.exit(1)
@@ -76,18 +82,22 @@ except Exception as e:
 suplementary_table = sys.argv[3]
 
 try:
-    sup_df = pd.read_csv(genomes_table, sep = '\t')
+    sup_df = pd.read_csv(suplementary_table, sep = '\t')
 except Exception as e:
     print(f'Error reading suplementary table: {e}')
     sys.exit(1)
 
+if "Subclade Classification" not in sup_df.columns:
+    print(f'Error: no "Subclade Classification" column in suplementary table {suplementary_table}')
+    sys.exit(1)
+sup_by_clade = index_by(sup_df, "Subclade Classification")
+
 
 # ANI information
 ANI_table = sys.argv[4]
 
 try:
-    colnames = ["Query", "Reference", "ANI", "Bidirectional mappings", "Query fragments"]
-    df = pd.read_csv(ANI_table, sep = '\t', names = colnames, header = None)
+    ani_matrix = load_matrix(ANI_table)
 except Exception as e:
     print(f'Error loading ANI table: {e}')
     sys.exit(1)
@@ -107,6 +117,7 @@ POP_data = sys.argv[6]
 
 try:
     pop_df = pd.read_csv(POP_data, sep = '\t')
+    pop_clusters = dict(zip(pop_df["Strain"], pop_df["Main_cluster"]))
 except Exception as e:
     print(f'Error reading PopCOGenT table: {e}')
     sys.exit(1)
@@ -116,7 +127,7 @@ CSF_json = sys.argv[7]
 
 try:
     with open(CSF_json, 'r') as file:
-        CSF_data = json.load(CSF_json)
+        CSF_data = json.load(file)
 except Exception as e:
     print(f'Error reading ConSpeciFix information: {e}')
     sys.exit(1)
@@ -127,31 +138,11 @@ print('All data read successfully!\n')
 
 
 ### ANI grouping
-full_dir = "/home/estudiante2/JMF/other_thresholds/SAR11_genomes/"  # Might be changed depending on ANI data
-
-df["Query"] = df["Query"].str.replace(full_dir, "", regex=False)
-df["Query"] = df["Query"].str.replace('.fa', "", regex=False)
-df["Reference"] = df["Reference"].str.replace(full_dir, "", regex=False)
-df["Reference"] = df["Reference"].str.replace('.fa', "", regex=False)
-
-# Extract all relations with > 95% ANI
-to_group = df[(df["ANI"] >= 95) & (df["Query"] != df["Reference"])]
-uniques = set(to_group["Query"].tolist())
 
-# Create new graph
-G=nx.Graph()
-
-# Nodes
-for unique in uniques:
-    G.add_node(unique)
-
-# Edges
-for idx, row in to_group.iterrows():
-    node1 = row["Query"]
-    node2 = row["Reference"]
-    G.add_edge(node1, node2)
-
-components = sorted(nx.connected_components(G), key=len, reverse=True)
+# Group genomes sharing > 95% ANI
+components = matrix_components(ani_matrix, 95)
+components = sorted(components, key=len, reverse=True)
+ANI_groups = membership(components)
 sources = components[0:sources_num]
 groups = components[sources_num:len(components)]
 
@@ -191,9 +182,10 @@ for name in all_genomes:
         
     clades.append(clade)
 
-    acc = gen_df.loc[gen_df["SAG or Isolate ID"] == isolate_id, "RefSeq Assembly (*IMG Genome ID)"].iloc[0]
-    comp = gen_df.loc[gen_df["SAG or Isolate ID"] == isolate_id, "Completeness"].iloc[0]
-    cont = gen_df.loc[gen_df["SAG or Isolate ID"] == isolate_id, "Contamination"].iloc[0]
+    genome_info = registry.isolate(isolate_id)
+    acc = genome_info["RefSeq Assembly (*IMG Genome ID)"]
+    comp = genome_info["Completeness"]
+    cont = genome_info["Contamination"]
 
     accs.append(acc)
     comps.append(comp)
@@ -202,14 +194,9 @@ for name in all_genomes:
     # __ANI species__
     unk_species_num = len(components) + 1
 
-    A = False
-    for i, comp in enumerate(components):
-        if name in comp:
-            ANI_species.append(i)
-            A = True
-            break
-
-    if not A:  # Genome does not belong to any specie
+    if name in ANI_groups:
+        ANI_species.append(ANI_groups[name])
+    else:  # Genome does not belong to any specie
         ANI_species.append(unk_species_num)
         unk_species_num += 1
 
@@ -224,7 +211,7 @@ for name in all_genomes:
     GTDB_genres.append(GTDB_genus.replace('g__', ''))
 
     # __PopCOGenT species__
-    POP_specie = POP_data.loc[POP_data["Strain"] == name, "Main_cluster"].iloc[0]
+    POP_specie = pop_clusters[name]
     POP_species.append(POP_specie)
 
     # __ConSpeciFix specie__
@@ -240,8 +227,8 @@ for name in all_genomes:
         CSF_species.append(unk_csf_num)
 
     # __Philogenetic information from supplementary data__
-    sup_genre = sup_df.loc[sup_df["Subclade Classification"] == clade, "Genus"].iloc[1]
-    sup_specie = sup_df.loc[sup_df["Subclade Classification"] == clade, "Species name"].iloc[1]
+    sup_genre = sup_by_clade[clade][1]["Genus"]
+    sup_specie = sup_by_clade[clade][1]["Species name"]
 
     sup_genres.append(sup_genre)
     sup_species.append(sup_specie)